@@ -21,6 +21,11 @@ export const NIGHTFALL_COLORSCALE = [
 ];
 
 
+function isArrayLike(values) {
+  return Array.isArray(values) || ArrayBuffer.isView(values);
+}
+
+
 export class BaseColorPlotter {
   constructor(containerId, meta = {}) {
     this.containerId = containerId;
@@ -103,11 +108,11 @@ export class BaseColorPlotter {
       console.error("BaseColorPlotter: Missing X, Y, or Z in result_dict.");
       return;
     }
-    const maxVal = Math.max(...result_dict.Z.flat());
+    // plain arrays, also from the typed arrays of a Result
     const trace = {
-      x: result_dict.X, //X[0],
-      y: result_dict.Y, //Y.map(row => row[0]),
-      z: result_dict.Z,
+      x: Array.from(result_dict.X), //X[0],
+      y: Array.from(result_dict.Y), //Y.map(row => row[0]),
+      z: Array.from(result_dict.Z, row => Array.from(row)),
       type: "heatmap",
       colorscale: this.colorscale,
       showscale: true,
@@ -138,10 +143,13 @@ export class BaseColorPlotter {
    */
   addOrUpdateLine(name, x, y, options = {}) {
     if (!this.initialized) this.init_empty();
-    if (!Array.isArray(x) || !Array.isArray(y)) {
+    if (!isArrayLike(x) || !isArrayLike(y)) {
       console.error("addOrUpdateLine: x and y must be arrays");
       return;
     }
+    // plain arrays, also from the typed arrays of a Result
+    x = Array.from(x);
+    y = Array.from(y);
 
   // Default: just lines
   let mode = "lines";
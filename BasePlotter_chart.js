@@ -145,14 +145,16 @@ export class BasePlotter {
     const marker = options.marker || "none";
     const alpha = options.alpha != null ? options.alpha : 1.0;
 
-    const newData = x.map((xi, i) => ({ x: xi, y: y[i] }));
+    // Array.from also takes the typed arrays of a Result
+    const newData = Array.from(x, (xi, i) => ({ x: xi, y: y[i] }));
 
     // === Matplotlib-style line dash mapping ===
     const dashMap = {
       "-": [],             // solid
       "--": [6, 4],        // dashed
       "-.": [6, 4, 2, 4],  // dash-dot
-      ":": [2, 4]          // dotted
+      ":": [2, 4],         // dotted
+      "none": []           // markers only, see showLine
     };
 
     const borderDash = dashMap[linestyle] ?? [];
@@ -181,6 +183,7 @@ export class BasePlotter {
       borderColor: rgbaColor,
       borderDash,
       borderWidth: linewidth,
+      showLine: linestyle !== "none",
       tension: 0.1,
       pointStyle,
       pointRadius: marker !== "none" ? 4 : 0,
@@ -0,0 +1,80 @@
+"""Result class carries the output of a backend function to the plotters.
+
+NumPy arrays are kept as contiguous float arrays. In the browser the template hands them
+to the plotters as Float64Array or Float32Array views of the Python memory (PyProxy
+getBuffer), instead of converting every number to a Python float, then to JSON text and
+back. Everything else (numbers, strings, nested lists and dicts) is converted with toJs.
+"""
+import json
+
+import numpy as np
+
+
+class Result(dict):
+
+    def __init__(self, *args, **kwargs):
+        """Dict of named values for the plotters, see from_values."""
+        super().__init__()
+        self.update(*args, **kwargs)
+
+    @classmethod
+    def from_values(cls, **values):
+        """Result of the given values.
+
+        Args:
+            values: ndarrays (float32 stays float32, other dtypes become float64), lists
+                of ndarrays (e.g. ragged lines), numbers, strings and json compatible
+                lists and dicts.
+        """
+        return cls(**values)
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, _plain(value))
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def array_names(self):
+        "Names of the values that are ndarrays."
+        return [key for key, value in self.items() if isinstance(value, np.ndarray)]
+
+    def array_list_names(self):
+        "Names of the values that are lists of ndarrays."
+        return [key for key, value in self.items() if _is_array_list(value)]
+
+    def fields(self):
+        "The values that are neither ndarrays nor lists of ndarrays, for toJs."
+        arrays = set(self.array_names() + self.array_list_names())
+        return {key: value for key, value in self.items() if key not in arrays}
+
+    def to_json(self):
+        "All values as json, e.g. for tests or backends outside the browser."
+        return json.dumps(self, default=_to_list)
+
+
+def _plain(value):
+    if isinstance(value, np.ndarray):
+        return _array(value)
+    if isinstance(value, (list, tuple)) and value and all(
+            isinstance(item, np.ndarray) for item in value):
+        return [_array(item) for item in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _array(array):
+    dtype = np.float32 if array.dtype == np.float32 else np.float64
+    return np.ascontiguousarray(array, dtype=dtype)
+
+
+def _is_array_list(value):
+    return isinstance(value, list) and bool(value) and all(
+        isinstance(item, np.ndarray) for item in value)
+
+
+def _to_list(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not json serializable")
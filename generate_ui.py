@@ -67,6 +67,14 @@ def build_elements(cfg):
               <button id="{el_id}">{spec.get("label", el_id.title())}</button>
             """
 
+        elif el_type == "file":
+            elements[el_id] = f"""
+              <div class="file-container">
+                <label for="{el_id}">{spec.get("label", el_id.title())}</label><br>
+                <input type="file" id="{el_id}" accept="{spec.get('accept', '')}">
+              </div>
+            """
+
         elif el_type == "plot":
             plot_el = "div"
             if spec.get("library", "") == "chart.js":
@@ -86,6 +94,24 @@ def build_elements(cfg):
 
     return elements
 
+TRIGGER_KEYS = {"control", "event", "debounce_ms", "throttle_ms", "idle_only", "preview"}
+TIMING_POLICIES = ("debounce_ms", "throttle_ms", "idle_only")
+
+def check_triggers(cfg):
+    """
+    Warn about trigger entries the template does not understand.
+    """
+    for fname, fmeta in cfg.get("functions", {}).items():
+        for trig in fmeta.get("trigger", []):
+            unknown = set(trig) - TRIGGER_KEYS
+            if unknown:
+                print(f"⚠️ {fname}: unknown trigger keys {sorted(unknown)} in {trig}")
+            timing = [key for key in TIMING_POLICIES if trig.get(key)]
+            if len(timing) > 1:
+                print(f"⚠️ {fname}: only {timing[0]} of {timing} is used in {trig}")
+            if "preview" in trig and not isinstance(trig["preview"], dict):
+                print(f"⚠️ {fname}: preview must map arguments to values in {trig}")
+
 def render_layout(layout, elements):
     if isinstance(layout, list):
         # Simple list → horizontal by default
@@ -132,6 +158,8 @@ def generate_ui(config_path):
     cfg.setdefault("backend_files", [])
     cfg.setdefault("python_packages", [])
 
+    check_triggers(cfg)
+
     # Build element HTML and layout
     elements = build_elements(cfg)
     layout_html = render_layout(cfg.get("layout", []), elements)
@@ -182,7 +210,12 @@ def generate_ui(config_path):
     out_html = output_dir / "index.html"
     out_html.write_text(html, encoding="utf-8")
 
-    print(f"✅ UI generated: {out_html}")
+    # Web Worker that runs the Python backend
+    worker = env.get_template("worker_template.js.j2").render(**cfg)
+    out_worker = output_dir / "worker.js"
+    out_worker.write_text(worker, encoding="utf-8")
+
+    print(f"✅ UI generated: {out_html}, {out_worker.name}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,34 @@
+// FitPlotter.js
+import { BasePlotter, getColorByIndex } from "../../BasePlotter_chart.js";
+
+export class FitPlotter extends BasePlotter {
+  constructor(canvasId, meta) {
+    super(canvasId, meta);
+  }
+
+  render(result) {
+    // nothing to show before a SED is loaded and fitted
+    if (!result.xdata) {
+      if (result.message) console.log(result.message);
+      return;
+    }
+
+    super.addOrUpdateLine("data", result.xdata, result.ydata,
+      {c: getColorByIndex(0), ls : "none", marker: "o", alpha: 1});
+    // 1 sigma band of the data
+    super.addOrUpdateLine("data_low", result.xdata, result.ydata_low,
+      {c: getColorByIndex(0), ls : ":", marker: "", alpha: 0.4});
+    super.addOrUpdateLine("data_high", result.xdata, result.ydata_high,
+      {c: getColorByIndex(0), ls : ":", marker: "", alpha: 0.4});
+    super.addOrUpdateLine("fit", result.xfit, result.yfit,
+      {c: getColorByIndex(10), ls : "-", marker: "", alpha: 1});
+
+    this.chart.options.plugins.title.text =
+      `${this.meta.title}: chi² = ${result.chi2.toFixed(1)} / ${result.dof} dof`;
+
+    const ymax = Math.max(...result.ydata_high);
+    const ymin = Math.min(...result.ydata_low);
+    super.setAxLimits(Math.min(...result.xdata) - 1, Math.max(...result.xdata) + 1,
+                      ymin - 0.2*(ymax - ymin) - 0.5, ymax + 0.2*(ymax - ymin) + 0.5);
+  }
+}
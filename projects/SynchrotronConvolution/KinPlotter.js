@@ -0,0 +1,30 @@
+// KinPlotter.js
+import { BasePlotter, getColorByIndex } from "../../BasePlotter_chart.js";
+
+export class KinPlotter extends BasePlotter {
+  constructor(canvasId, meta) {
+    super(canvasId, meta);
+    // "el" or "phot", which spectra of calcSynKinetic to show
+    this.quantity = meta.quantity || "phot";
+  }
+
+  render(result) {
+    const x = result["x" + this.quantity];
+
+    super.addOrUpdateLine("steady", x, result["y" + this.quantity + "_ss"],
+      {c: getColorByIndex(10), ls : "--", marker: "", alpha: 1});
+
+    for (let index = 0; index < 8; index++) {
+      if (index<result.lgt.length) {
+        super.addOrUpdateLine("t_"+index, x, result["y" + this.quantity + "_" + index],
+          {c: getColorByIndex(index), ls : "-", marker: "", alpha: 0.8});
+      } else {
+        super.removeLine("t_"+index);
+      }
+    }
+
+    const lgt = result.lgt.length ? result.lgt[result.lgt.length - 1].toFixed(1) : "-";
+    this.chart.options.plugins.title.text = `${this.meta.title}, lg t = ${lgt} s`;
+    super.setAxLimits(Math.min(...x), Math.max(...x), -9, 1);
+  }
+}
@@ -0,0 +1,139 @@
+import numpy as np
+from scipy.linalg import solve_banded
+# from synchrotronCalc import _electronStage, _photonGrid
+# from emissionKernels import emission
+# import physicsConsts as c
+# from backend_common.result import Result
+
+
+def synCoolingRate(E, B):
+    '''synchrotron energy loss rate -dE/dt in erg/s of ultrarelativistic electrons of
+    energy E [erg] in the field B [G], averaged over an isotropic pitch angle distribution'''
+    return 4/3 * sigma_T * c * (E/mec2)**2 * B**2/(8*np.pi)
+
+
+def changCooper(E, cooling, diffusion=None):
+    '''Interface coefficients of the Chang & Cooper (1970) discretisation of
+    dN/dt = d/dE [ D dN/dE + b N ] on the cell centres E, with the flux between cells j
+    and j+1 F = P_j N_{j+1} - M_j N_j. The centring weight follows from D and b, so that
+    N stays positive; without diffusion the scheme is upwind in the direction of b.
+
+    Args:
+        E (ndarray): cell centres in erg, increasing.
+        cooling (callable): b(E) = -dE/dt in erg/s.
+        diffusion (callable, optional): D(E) in erg**2/s. Defaults to none.
+
+    Returns:
+        P, M at the N-1 interfaces and the N cell widths in erg.
+    '''
+    E_half = np.sqrt(E[1:]*E[:-1])
+    edges = np.concatenate([[E[0]**2/E_half[0]], E_half, [E[-1]**2/E_half[-1]]])
+    dE = np.diff(E)
+    b = cooling(E_half)
+    D = diffusion(E_half) if diffusion is not None else np.zeros(len(E_half))
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        w = b*dE/D
+        delta = np.where(np.abs(w) < 1e-8, 0.5, 1/w - 1/np.expm1(w))
+    delta = np.where(D > 0, delta, (b < 0).astype(float))
+    P = D/dE + b*(1 - delta)
+    M = D/dE - b*delta
+    return P, M, np.diff(edges)
+
+
+def _bands(P, M, width, dt, t_esc):
+    '''matrix of one backward Euler step (dt = inf for the steady state), in the banded
+    form of scipy.linalg.solve_banded, with zero flux through both ends of the grid'''
+    ab = np.zeros((3, len(width)))
+    ab[0, 1:] = -P/width[:-1]
+    ab[2, :-1] = -M/width[1:]
+    ab[1, :-1] += M/width[:-1]
+    ab[1, 1:] += P/width[1:]
+    ab[1] += 1/t_esc
+    if np.isfinite(dt):
+        ab *= dt
+        ab[1] += 1
+    return ab
+
+
+def evolveElectrons(E, Q, cooling, t_esc, t_out, steps=300, diffusion=None, N0=None):
+    '''Solves the electron continuity equation
+    dN/dt = d/dE [ D dN/dE + b N ] - N/t_esc + Q
+    with the implicit Chang-Cooper scheme. Each time step is one O(N) tridiagonal solve,
+    so that a few hundred steps take milliseconds. The steps are spaced logarithmically in
+    time, since cooling at high energies is much faster than at low energies.
+
+    Args:
+        E (ndarray): cell centres in erg, increasing.
+        Q (ndarray): injection rate per energy at E, constant in time.
+        cooling (callable): b(E) = -dE/dt in erg/s, e.g. synCoolingRate.
+        t_esc (float): escape time in s.
+        t_out (ndarray): increasing output times in s.
+        steps (int, optional): number of time steps up to t_out[-1].
+        diffusion (callable, optional): momentum diffusion coefficient D(E) in erg**2/s.
+        N0 (ndarray, optional): spectrum at t = 0. Defaults to no electrons.
+
+    Yields:
+        output time and the spectrum N(E) at that time.
+    '''
+    P, M, width = changCooper(E, cooling, diffusion)
+    t_out = np.asarray(t_out, dtype=float)
+    times = np.union1d(np.geomspace(t_out[-1]*1e-4, t_out[-1], steps), t_out)
+    N = np.zeros(len(E)) if N0 is None else np.array(N0, dtype=float)
+    t = 0
+    for t_next in times:
+        N = solve_banded((1, 1), _bands(P, M, width, t_next - t, t_esc), N + (t_next - t)*Q,
+                         check_finite=False)
+        t = t_next
+        if np.any(np.isclose(t, t_out, rtol=1e-12, atol=0)):
+            yield t, N
+
+
+def steadyElectrons(E, Q, cooling, t_esc, diffusion=None):
+    "steady state of evolveElectrons, a single tridiagonal solve"
+    P, M, width = changCooper(E, cooling, diffusion)
+    return solve_banded((1, 1), _bands(P, M, width, np.inf, t_esc), Q, check_finite=False)
+
+
+def synFromElectrons(E, N, Ephs, B):
+    '''synchrotron spectrum of the electron spectra N (rows) on the grid E, with the cached
+    kernel matrix of emission, which all output times and slider moves that keep the grids
+    and B share'''
+    return emission("synchrotron", E, np.atleast_2d(N), Ephs, B=B)
+
+
+def calcSynKinetic(lgEmin, lgEb, lgEmax, p, dp, lgs, lgchi, lgB, lgtesc, lgtmax, Nt, lgintRes,
+                   steps=300):
+    '''Electron and synchrotron spectra at Nt output times, one per decade up to 10**lgtmax s,
+    for the injection of the sbpl spectrum of calcSyn into a region with synchrotron
+    cooling in the field 10**lgB G and escape after 10**lgtesc s.
+
+    A generator, which yields the spectra of all output times so far after each output
+    time, normalised to the peaks of the steady state.'''
+    Nt = int(Nt)
+    Q, Emin, Eb, Emax, _ = _electronStage(lgEmin, lgEb, lgEmax, p, dp, lgs, lgchi)
+    B = 10**lgB
+    Eintmin = np.max([1e-1*Emin, mec2])
+    Eintmax = 1e2*Emax
+    E = np.logspace(np.log10(Eintmin), np.log10(Eintmax),
+                    int(np.log10(Eintmax/Eintmin) * 10**lgintRes) + 1)
+    Ephs = _photonGrid(lgEmin, lgEmax, lgB)
+
+    def cooling(E):
+        return synCoolingRate(E, B)
+    N_ss = steadyElectrons(E, Q(E), cooling, 10**lgtesc)
+    F_ss = synFromElectrons(E, N_ss, Ephs, B)[0]
+    norm_el = np.max(E**2*N_ss)
+    norm_ph = np.max(Ephs**2*F_ss)
+
+    results = {
+        "xel": np.log10(E*erg2eV), "xphot": np.log10(Ephs*erg2eV),
+        "yel_ss": np.log10(E**2*N_ss/norm_el + 1e-30),
+        "yphot_ss": np.log10(Ephs**2*F_ss/norm_ph + 1e-30),
+        "lgt": []}
+    t_out = 10.**(lgtmax - np.arange(Nt)[::-1])
+    for i, (t, N) in enumerate(evolveElectrons(E, Q(E), cooling, 10**lgtesc, t_out, steps)):
+        F = synFromElectrons(E, N, Ephs, B)[0]
+        results["lgt"].append(float(np.log10(t)))
+        results[f"yel_{i}"] = np.log10(E**2*N/norm_el + 1e-30)
+        results[f"yphot_{i}"] = np.log10(Ephs**2*F/norm_ph + 1e-30)
+        yield Result({**results, "lgt": list(results["lgt"])})
@@ -0,0 +1,78 @@
+import numpy as np
+from functools import lru_cache
+# from synchrotronCalc import Kernel_Syn_tab
+
+# registry of emission kernels, name -> {"kernel": K(E_electron, E_photon, *params),
+# "params": names of the parameters K depends on}
+KERNELS = {}
+# number of kernel matrices kept by kernelMatrix
+KERNEL_CACHE_SIZE = 8
+
+
+def registerKernel(name, kernel, params=()):
+    '''Adds an emission kernel to KERNELS.
+
+    Args:
+        name (str): name of the kernel, e.g. "synchrotron".
+        kernel (callable): K(E_electron, E_photon, *params), the emitted spectrum of one
+            electron, broadcasting over its energy arguments like Kernel_Syn.
+        params (tuple, optional): names of the parameters K takes after the energies, in
+            order. Only these enter the cache key of the kernel matrix, so other
+            parameters (e.g. of the electron spectrum) never invalidate it.
+    '''
+    KERNELS[name] = {"kernel": kernel, "params": tuple(params)}
+
+
+def kernelParams(name, params):
+    "values of the parameters of the kernel name, taken from the dict params"
+    missing = [p for p in KERNELS[name]["params"] if p not in params]
+    if missing:
+        raise ValueError(f"Kernel {name} needs the parameters {', '.join(missing)}.")
+    return tuple(float(params[p]) for p in KERNELS[name]["params"])
+
+
+def kernelMatrix(name, E_electron, E_photon, **params):
+    '''Kernel name evaluated on the grids, shape (len(E_photon), len(E_electron)).
+
+    The matrix is cached (least recently used, KERNEL_CACHE_SIZE matrices) on the kernel,
+    the grids and the values of the parameters the kernel declares; further keyword
+    arguments are ignored. The returned matrix is read-only.
+    '''
+    E_electron = np.ascontiguousarray(E_electron, dtype=float)
+    E_photon = np.ascontiguousarray(E_photon, dtype=float)
+    return _kernelMatrix(name, E_electron.tobytes(), E_photon.tobytes(), kernelParams(name, params))
+
+
+@lru_cache(maxsize=KERNEL_CACHE_SIZE)
+def _kernelMatrix(name, E_electron, E_photon, values):
+    E_electron = np.frombuffer(E_electron)
+    E_photon = np.frombuffer(E_photon)
+    matrix = KERNELS[name]["kernel"](E_electron[None, :], E_photon[:, None], *values)
+    matrix.flags.writeable = False
+    return matrix
+
+
+def emission(name, E_electron, N_electron, E_photon, **params):
+    '''Emitted spectrum of the electron spectra N_electron (rows, per energy, on the grid
+    E_electron) at E_photon, the integral of K(E, E_photon) N(E) dE by the trapezoidal rule
+    in ln E. With a cached kernel matrix this is one matrix-vector product.
+
+    Args:
+        name (str): registered kernel, see registerKernel.
+        E_electron (ndarray): increasing electron energies in erg.
+        N_electron (ndarray): electron spectrum at E_electron, or one spectrum per row.
+        E_photon (ndarray): photon energies in erg.
+        params: parameters of the kernel, e.g. B for "synchrotron".
+
+    Returns:
+        spectrum of shape N_electron.shape[:-1] + (len(E_photon),).
+    '''
+    u = np.log(E_electron)
+    weights = np.zeros(len(u))
+    weights[1:] += np.diff(u)/2
+    weights[:-1] += np.diff(u)/2
+    return (weights*E_electron*np.asarray(N_electron)) @ kernelMatrix(
+        name, E_electron, E_photon, **params).T
+
+
+registerKernel("synchrotron", Kernel_Syn_tab, ("B",))
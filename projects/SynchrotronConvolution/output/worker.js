@@ -0,0 +1,146 @@
+// worker.js of Synchrotron Convolution, generated by generate_ui.py
+// Runs Pyodide and the Python backend off the main thread. The page posts one message
+// per function call, { funcName, args }, and gets back { type: "result", funcName, result }
+// for every result (every level of a progressive function), "error" messages and one
+// "ready" message once the backend is loaded.
+
+import { loadPyodide } from "https://cdn.jsdelivr.net/pyodide/v0.25.0/full/pyodide.mjs";
+
+const functions = {"calcSyn": {"args": ["lgEmin", "lgEb", "lgEmax", "p", "dp", "lgs", "lgchi", "lgB", "lgEelDelta", "NvisEl", "lgintRes"], "trigger": [{"control": "lgEmin", "event": "input"}, {"control": "lgEb", "event": "input"}, {"control": "lgEmax", "event": "input"}, {"control": "p", "event": "input"}, {"control": "dp", "event": "input"}, {"control": "lgs", "event": "input"}, {"control": "lgchi", "event": "input"}, {"control": "lgB", "event": "input"}, {"control": "lgEelDelta", "event": "input"}, {"control": "NvisEl", "event": "input"}, {"control": "lgintRes", "debounce_ms": 150, "event": "input"}], "updates": ["plot_el", "plot_ph"]}, "calcSynKinetic": {"args": ["lgEmin", "lgEb", "lgEmax", "p", "dp", "lgs", "lgchi", "lgB", "lgtesc", "lgtmax", "Nt", "lgintRes"], "progressive": true, "trigger": [{"control": "lgEmin", "event": "input", "preview": {"steps": 60}}, {"control": "lgEb", "event": "input", "preview": {"steps": 60}}, {"control": "lgEmax", "event": "input", "preview": {"steps": 60}}, {"control": "p", "event": "input", "preview": {"steps": 60}}, {"control": "dp", "event": "input", "preview": {"steps": 60}}, {"control": "lgs", "event": "input", "preview": {"steps": 60}}, {"control": "lgchi", "event": "input", "preview": {"steps": 60}}, {"control": "lgB", "event": "input", "preview": {"steps": 60}}, {"control": "lgtesc", "event": "input", "preview": {"steps": 60}}, {"control": "lgtmax", "event": "input", "preview": {"steps": 60}}, {"control": "Nt", "event": "input"}, {"control": "lgintRes", "debounce_ms": 150, "event": "input"}], "updates": ["plot_kin_el", "plot_kin_ph"]}, "fitSyn": {"args": ["sed", "lgEmin", "lgEb", "lgEmax", "p", "dp", "lgs", "lgchi", "lgB", "lgintRes"], "trigger": [{"control": "fit", "event": "click"}], "updates": ["plot_fit"]}};
+
+const ready = (async () => {
+  const pyodide = await loadPyodide();
+  console.log("✅ Pyodide loaded");
+  // Redirect Python print to JS console
+  pyodide.setStdout({
+    batched: (s) => console.log(s)
+  });
+  pyodide.setStderr({
+    batched: (s) => console.error(s)
+  });
+
+  // Load required Python packages from YAML
+  const pkgs = ["numpy", "scipy", "micropip"];
+  for (const pkg of pkgs) {
+    console.log(`📦 Loading ${pkg} ...`);
+    try {
+      await pyodide.loadPackage(pkg);
+    } catch (err) {
+      console.warn(`⚠️ Could not load ${pkg} automatically, trying micropip`);
+      const micropip = pyodide.pyimport("micropip");
+      await micropip.install(pkg);
+    }
+  }
+
+  // Load Python files relative to worker.js (the output/ folder, like index.html)
+  console.log("Load python files");
+  for (const f of ["../../../backend_common/result.py", ...["../synchrotronCalc.py", "../physicsConsts.py", "../emissionKernels.py", "../synchrotronFit.py", "../electronKinetics.py"]]) {
+    pyodide.runPython(await (await fetch(f)).text());
+  }
+  postMessage({ type: "ready" });
+  return pyodide;
+})();
+
+
+// Latest-wins scheduling: the newest call of each function that has not started yet, in
+// the order the functions were first called. A newer call replaces the pending one, so
+// the backend only works on parameters that still matter.
+const pending = new Map();
+let busy = false;
+
+self.onmessage = event => {
+  pending.set(event.data.funcName, event.data);
+  if (!busy) work();
+};
+
+async function work() {
+  busy = true;
+  const pyodide = await ready;
+  while (pending.size) {
+    const [funcName, call] = pending.entries().next().value;
+    pending.delete(funcName);
+    try {
+      await run(pyodide, call);
+    } catch (err) {
+      postMessage({ type: "error", funcName, message: String(err) });
+    }
+  }
+  busy = false;
+}
+
+async function run(pyodide, call) {
+  const args = Object.entries(call.args).map(([id, value]) => {
+    if (value === null) return `${id}=None`;
+    if (typeof value === "string") {
+      // text of a file element, passed as a Python global
+      pyodide.globals.set(`_file_${id}`, value);
+      return `${id}=_file_${id}`;
+    }
+    return `${id}=${value}`;
+  });
+  const value = await pyodide.runPythonAsync(`${call.funcName}(${args.join(", ")})`);
+  if (!functions[call.funcName].progressive) {
+    post(call.funcName, value);
+    return;
+  }
+
+  // the function is a generator of results from coarse to fine
+  try {
+    for (let level = value.next(); !level.done; level = value.next()) {
+      post(call.funcName, level.value);
+      // receive newer calls, a newer call of this function ends this one
+      await new Promise(resolve => setTimeout(resolve, 0));
+      if (pending.has(call.funcName)) break;
+    }
+  } finally {
+    value.destroy();
+  }
+}
+
+function post(funcName, value) {
+  const { result, transfer } = unpack(value);
+  postMessage({ type: "result", funcName, result }, transfer);
+}
+
+// Turns what a function returned into a plain object: json text, or a Result
+// (backend_common/result.py) whose arrays are copied once out of the Python memory into
+// Float64Array/Float32Array, whose buffers are transferred to the page, 2D arrays as
+// arrays of row views of one buffer.
+function unpack(value) {
+  if (typeof value === "string") return { result: JSON.parse(value), transfer: [] };
+  if (typeof value.array_names !== "function") {
+    const result = value.toJs({ dict_converter: Object.fromEntries });
+    value.destroy();
+    return { result, transfer: [] };
+  }
+  const names = method => {
+    const proxy = value[method]();
+    const list = proxy.toJs();
+    proxy.destroy();
+    return list;
+  };
+  const transfer = [];
+  const copy = array => {
+    const buffer = array.getBuffer();
+    array.destroy();
+    const data = buffer.data.slice();
+    const shape = buffer.shape;
+    buffer.release();
+    transfer.push(data.buffer);
+    if (shape.length < 2) return data;
+    const n = shape[1];
+    return Array.from({ length: shape[0] }, (_, i) => data.subarray(i*n, (i + 1)*n));
+  };
+
+  const fields = value.fields();
+  const result = fields.toJs({ dict_converter: Object.fromEntries });
+  fields.destroy();
+  for (const name of names("array_names")) result[name] = copy(value.get(name));
+  for (const name of names("array_list_names")) {
+    const list = value.get(name);
+    result[name] = Array.from(list, copy);
+    list.destroy();
+  }
+  value.destroy();
+  return { result, transfer };
+}
\ No newline at end of file
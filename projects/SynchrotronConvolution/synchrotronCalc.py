@@ -1,9 +1,10 @@
-
 import numpy as np
 from scipy.integrate import simps
-from scipy.special import kv
+from scipy.signal import fftconvolve
+from scipy.special import kv, kve
 # import physicsConsts as c
-import json
+# from backend_common.result import Result
+from functools import lru_cache
 
 def visualiseConvolution(dN_dx, K, Kparams, x_eval, Nfull, xmin, xmax, x_vis_list):
     # full result
@@ -17,6 +18,10 @@ def visualiseConvolution(dN_dx, K, Kparams, x_eval, Nfull, xmin, xmax, x_vis_lis
     du = u1D[1] - u1D[0]
     sumResult = du*y #np.sum(du*y, axis=1)
 
+    return fullResult, sumResult, visualiseBins(dN_dx, K, Kparams, x_eval, x_vis_list)
+
+
+def visualiseBins(dN_dx, K, Kparams, x_eval, x_vis_list):
     # representative bins
     vis_list = []
     for x_vis in x_vis_list:
@@ -25,7 +30,106 @@ def visualiseConvolution(dN_dx, K, Kparams, x_eval, Nfull, xmin, xmax, x_vis_lis
         else:
             vis_list.append(x_vis*dN_dx(x_vis)*K(x_vis, x_eval))
 
-    return fullResult, sumResult, np.array(vis_list)
+    return np.array(vis_list)
+
+
+def adaptiveConvolution(dN_dx, K, Kparams, x_eval, xmin, xmax, rtol=1e-3, order=8,
+                        max_evaluations=2**22):
+    '''The integral of visualiseConvolution by adaptive Gauss-Legendre quadrature in ln x.
+
+    All x_eval share one set of panels. A panel is compared with the sum over its two
+    halves and accepted once the difference, relative to the integral at every x_eval,
+    is below its share rtol*(panel length)/(ln xmax - ln xmin); otherwise its halves are
+    refined further. x_eval where the integral is below 1e-30 of its largest value do
+    not drive the refinement.
+
+    Returns:
+        integral at x_eval, its largest estimated relative error, and the number of
+        kernel evaluations.
+    '''
+    nodes, weights = np.polynomial.legendre.leggauss(order)
+    x_eval = np.asarray(x_eval)
+    evaluations = [0]
+
+    def quadrature(a, b):
+        # panels (a, b) along axis 0, x_eval along axis 1
+        u = 0.5*(a + b)[:, None]  + 0.5*(b - a)[:, None]*nodes[None, :]
+        x = np.exp(u)[:, None, :]
+        args = (x, x_eval[None, :, None]) + tuple(Kparams or ())
+        evaluations[0] += x.size*len(x_eval)
+        y = x*dN_dx(x)*K(*args)
+        return 0.5*(b - a)[:, None]*np.sum(weights*y, axis=-1)
+
+    umin, umax = np.log(xmin), np.log(xmax)
+    edges = np.linspace(umin, umax, int(np.ceil(np.log10(xmax/xmin))) + 1)
+    a, b = edges[:-1], edges[1:]
+    Q = quadrature(a, b)
+    total = np.zeros(len(x_eval))
+    error = np.zeros(len(x_eval))
+    while len(a) > 0:
+        m = 0.5*(a + b)
+        Q_left = quadrature(a, m)
+        Q_right = quadrature(m, b)
+        refined = Q_left + Q_right
+        panel_error = np.abs(Q - refined)
+        estimate = total + np.sum(refined, axis=0)
+        scale = np.where(estimate > 1e-30*np.max(np.abs(estimate)), np.abs(estimate), np.inf)
+        done = np.all(panel_error/scale <= rtol*(b - a)[:, None]/(umax - umin), axis=1)
+        if evaluations[0] >= max_evaluations:
+            done[:] = True
+        total += np.sum(refined[done], axis=0)
+        error += np.sum(panel_error[done], axis=0)
+        a, m, b = a[~done], m[~done], b[~done]
+        a, b = np.concatenate([a, m]), np.concatenate([m, b])
+        Q = np.concatenate([Q_left[~done], Q_right[~done]])
+    scale = np.where(total > 1e-30*np.max(np.abs(total)), np.abs(total), np.inf)
+    return total, np.max(error/scale), evaluations[0]
+
+
+def synConvolutionFFT(dN_dx, B, Ephs, Nfull, xmin, xmax):
+    '''Synchrotron spectrum of the electrons dN_dx at the log-spaced photon energies Ephs,
+    the integral of visualiseConvolution with Kernel_Syn_tab as FFT convolution.
+
+    With w = 2 ln E_electron and v = ln E_photon the kernel only depends on v - w through
+    xc, so the integral is a convolution on a grid of step ln(Ephs[1]/Ephs[0])/m in w and v,
+    with m chosen such that the electron grid is at least as fine as Nfull points in
+    [xmin, xmax]. Electron spectrum and kernel are tilted by E_electron**(1/3) and xc**(5/3)
+    to keep both bounded. Photon energies where the result is below the round-off of the FFT
+    are summed directly on the same grid.
+    '''
+    v_ph = np.log(Ephs)
+    dv = v_ph[1] - v_ph[0]
+    if not np.allclose(np.diff(v_ph), dv):
+        raise ValueError("Ephs must be log-spaced.")
+    du = np.log(xmax/xmin)/(Nfull - 1)
+    m = int(np.ceil(dv/(2*du)))
+    dw = dv/m
+    Nw = int(np.ceil(2*np.log(xmax/xmin)/dw)) + 1
+    w = 2*np.log(xmin) + dw*np.arange(Nw)
+    Nv = (len(Ephs) - 1)*m + 1
+    # xc = a*exp(v - w)
+    a = mec2*Bc/(3*B)
+    s = v_ph[0] - w[-1] + dw*np.arange(Nv + Nw - 1)
+    x = a*np.exp(s)
+    kernel = syn_G_tab(x)*x**(5/3)
+    E_el = np.exp(w/2)
+    # trapezoidal rule, the last cell ends at xmax with the integrand interpolated linearly
+    theta = 1 - (w[-1] - 2*np.log(xmax))/dw
+    weights = np.full(Nw, dw)
+    weights[0] /= 2
+    weights[-2] = dw/2 + theta*dw*(1 - theta/2) if Nw > 2 else theta*dw*(1 - theta/2)
+    weights[-1] = theta**2*dw/2
+    electrons = weights*E_el**(1/3)*dN_dx(E_el)
+    conv = fftconvolve(electrons, kernel)[Nw - 1:Nw - 1 + Nv:m]
+    # direct sums below the FFT round-off
+    tail = np.flatnonzero(conv < 1e3*np.finfo(float).eps*Nw*np.max(np.abs(conv)))
+    if len(tail) > 0:
+        index = m*tail[:, None] + Nw - 1 - np.arange(Nw)[None, :]
+        conv[tail] = np.sum(electrons[None, :]*kernel[index], axis=1)
+    constants = 2*np.sqrt(3)/9  * alphaF
+    norm = mec2**4 /h
+    # 1/2 from du = dw/2
+    return constants * norm * Bc/B * a**(-5/3)/2 * Ephs**(-2/3) * conv
 
 
 def Kernel_Syn(E_electron, E_photon, B):
@@ -37,20 +141,59 @@ def Kernel_Syn(E_electron, E_photon, B):
         (kv(4/3, xc)*kv(1/3, xc) - 3/5*xc*(kv(4/3, xc)**2 - kv(1/3, xc)**2))
     )
 
+def syn_G(x):
+    '''x dependence of Kernel_Syn times exp(2x), from exponentially scaled Bessel functions'''
+    k43 = kve(4/3, x)
+    k13 = kve(1/3, x)
+    return k43*k13 - 3/5*x*(k43 - k13)*(k43 + k13)
+
+
+# lookup table of ln(syn_G) on a log-spaced grid of x, built once at load time
+SYN_TABLE_XMIN = 1e-12
+SYN_TABLE_XMAX = 400
+SYN_TABLE_PER_DECADE = 64
+
+def _syn_table():
+    lnx = np.linspace(np.log(SYN_TABLE_XMIN), np.log(SYN_TABLE_XMAX),
+                      int(np.log10(SYN_TABLE_XMAX/SYN_TABLE_XMIN)*SYN_TABLE_PER_DECADE) + 1)
+    return lnx, np.log(syn_G(np.exp(lnx)))
+
+_syn_lnx, _syn_lnG = _syn_table()
+
+def syn_G_tab(x):
+    '''syn_G(x)*exp(-2x) by linear interpolation of the lookup table in ln x, with a
+    relative error below 1e-5. Below the table the asymptote G ~ x**(-5/3) is used,
+    above it G ~ x**(-2) exp(-2x) underflows to 0.'''
+    lnx = np.log(x)
+    lnG = (np.interp(lnx, _syn_lnx, _syn_lnG)
+           - 5/3*np.minimum(lnx - _syn_lnx[0], 0) - 2*np.maximum(lnx - _syn_lnx[-1], 0))
+    return np.exp(lnG - 2*x)
+
+def Kernel_Syn_tab(E_electron, E_photon, B):
+    '''Kernel_Syn with the Bessel functions replaced by the lookup table syn_G_tab'''
+    xc = mec2  * E_photon/(3* B/Bc * E_electron**2)
+    constants = 2*np.sqrt(3)/9  * alphaF
+    norm = mec2**4 /h
+    return constants * norm * Bc/B *E_photon/E_electron**4 * syn_G_tab(xc)
+
 def sbpl(E, N0, E0, p, dp, Eb, s):
     return N0 * (E/E0)**(-p) * (1+ (E/Eb)**(dp*s))**(-1/s)
 
 def Esyn(Eel, B):
     return B/Bc * Eel**2/mec2
 
-def calcSyn(lgEmin, lgEb, lgEmax, p, dp, lgs, lgchi, lgB, lgEelDelta, NvisEl, lgintRes):
+def _readonly(*arrays):
+    for array in arrays:
+        array.flags.writeable = False
+    return arrays
+
 
+@lru_cache(maxsize=8)
+def _electronStage(lgEmin, lgEb, lgEmax, p, dp, lgs, lgchi):
+    '''electron spectrum and its plot, depends on the electron parameters only'''
     results = {}
-    EelDelta = 10** lgEelDelta
     s =10**lgs
     chi = 10**lgchi
-    B = 10**lgB
-    intRes = 10** lgintRes
 
     # electron parameters
     Emin = 10**lgEmin * eV2erg
@@ -62,38 +205,183 @@ def calcSyn(lgEmin, lgEb, lgEmax, p, dp, lgs, lgchi, lgB, lgEelDelta, NvisEl, lg
     # electron plot
     Es = np.logspace(np.max([np.log10(Emin)-1, np.log10(1e6*eV2erg)]), np.log10(Emax)+1, 100) # * eV2erg
     normel = np.max(Es**2 * Nel(Es))
-    results["xel"] = list(np.log10(Es*erg2eV))
-    results["yel"] =  list(np.log10(Es**2 * Nel(Es) / normel + 1e-10 ))
+    results["xel"], results["yel"] = _readonly(
+        np.log10(Es*erg2eV), np.log10(Es**2 * Nel(Es) / normel + 1e-10))
+    return Nel, Emin, Eb, Emax, results
+
+
+@lru_cache(maxsize=8)
+def _photonGrid(lgEmin, lgEmax, lgB):
+    B = 10**lgB
+    Esynmin = Esyn(10**lgEmin * eV2erg, B)
+    Esynmax = Esyn(10**lgEmax * eV2erg, B)
+    Ephs = np.logspace(np.max([np.log10(Esynmin)-5, np.log10(1e-9*eV2erg)]), np.log10(Esynmax)+3, 200) #* eV2erg
+    return _readonly(Ephs)[0]
+
+
+@lru_cache(maxsize=8)
+def _synchrotronStage(lgEmin, lgEb, lgEmax, p, dp, lgs, lgchi, lgB, lgintRes, method, rtol):
+    '''synchrotron spectrum and its plot, independent of the representative bins'''
+    results = {}
+    B = 10**lgB
+    intRes = 10** lgintRes
+    Nel, Emin, Eb, Emax, _ = _electronStage(lgEmin, lgEb, lgEmax, p, dp, lgs, lgchi)
+    Ephs = _photonGrid(lgEmin, lgEmax, lgB)
 
-    
     # synchrotron spectrum
     Eintmin = np.max([1e-1*Emin, mec2])
     Eintmax = 1e2*Emax
-    Esynmin = Esyn(Emin, B)
-    Esynb = Esyn(Eb, B)
-    Esynmax = Esyn(Emax, B)
-    Ephs = np.logspace(np.max([np.log10(Esynmin)-5, np.log10(1e-9*eV2erg)]), np.log10(Esynmax)+3, 200) #* eV2erg
+    Nel_int = np.log10(Eintmax/Eintmin) * intRes
 
+    if method == "simps":
+        fullSyn = visualiseConvolution(
+            Nel, Kernel_Syn_tab, [B], Ephs, int(Nel_int), Eintmin, Eintmax, []
+        )[0]
+    elif method == "matrix":
+        # cached kernel matrix on the integration grid, reused while only the shape of the
+        # electron spectrum (p, dp, s, chi, Eb) changes
+        E = np.exp(np.linspace(np.log(Eintmin), np.log(Eintmax), int(Nel_int)))
+        fullSyn = emission("synchrotron", E, Nel(E), Ephs, B=B)
+    elif method == "adaptive":
+        # error controlled by rtol instead of intRes
+        fullSyn, results["error"], results["evaluations"] = adaptiveConvolution(
+            Nel, Kernel_Syn_tab, [B], Ephs, Eintmin, Eintmax, rtol
+        )
+    else:
+        fullSyn = synConvolutionFFT(Nel, B, Ephs, int(Nel_int), Eintmin, Eintmax)
+    if method == "validate":
+        # largest deviation of the FFT convolution from the simps integral in dex
+        simpsSyn = visualiseConvolution(
+            Nel, Kernel_Syn_tab, [B], Ephs, int(Nel_int), Eintmin, Eintmax, []
+        )[0]
+        valid = simpsSyn > 1e-30*np.max(simpsSyn)
+        results["validation"] = np.max(np.abs(np.log10(fullSyn[valid]/simpsSyn[valid])))
+
+    # photon plot
+    normSyn = np.max(Ephs**(2) * fullSyn)
+    results["xphot"], results["yphot"] = _readonly(
+        np.log10(Ephs*erg2eV), np.log10(Ephs**(2) * fullSyn / normSyn + 1e-30))
+    results["Esynmin"] = np.log10(Esyn(Emin, B)*erg2eV)
+    results["Esynb"] = np.log10(Esyn(Eb, B)*erg2eV)
+    results["Esynmax"] = np.log10(Esyn(Emax, B)*erg2eV)
+    return _readonly(fullSyn)[0], normSyn, results
+
+
+@lru_cache(maxsize=8)
+def _visualStage(lgEmin, lgEb, lgEmax, p, dp, lgs, lgchi, lgB, lgEelDelta, NvisEl):
+    '''photon spectra of the representative electron energies, independent of intRes'''
+    B = 10**lgB
+    Nel, Emin, Eb, Emax, _ = _electronStage(lgEmin, lgEb, lgEmax, p, dp, lgs, lgchi)
+    Ephs = _photonGrid(lgEmin, lgEmax, lgB)
     if NvisEl > 1:
         x_vis_list = np.logspace(np.log10(Emin), np.log10(Emax), NvisEl)
     else:
-        x_vis_list = [EelDelta*eV2erg]
-    Nel_int = np.log10(Eintmax/Eintmin) * intRes
+        x_vis_list = np.array([10**lgEelDelta*eV2erg])
+    vis = visualiseBins(Nel, Kernel_Syn_tab, [B], Ephs, x_vis_list)
+    return _readonly(x_vis_list, vis)
 
-    fullSyn, sumR, vis = visualiseConvolution(
-        Nel, Kernel_Syn, [B], Ephs, int(Nel_int), Eintmin, Eintmax, x_vis_list
-    )
 
-    # photon plot
-    normSyn = np.max(Ephs**(2) * fullSyn)
-    results["xphot"] = list(np.log10(Ephs*erg2eV))
-    results["yphot"] = list(np.log10(Ephs**(2) * fullSyn / normSyn + 1e-30))
-    results["Esynmin"] = np.log10(Esynmin*erg2eV)
-    results["Esynb"] = np.log10(Esynb*erg2eV)
-    results["Esynmax"] = np.log10(Esynmax*erg2eV)
+def calcSyn(lgEmin, lgEb, lgEmax, p, dp, lgs, lgchi, lgB, lgEelDelta, NvisEl, lgintRes, method="fft",
+            rtol=1e-3):
+    '''Electron and synchrotron spectra for the plots. The stages are cached on the
+    arguments they depend on, so that e.g. moving NvisEl does not redo the convolution.
+
+    method is "fft" (synConvolutionFFT), "simps" (visualiseConvolution), "matrix" (emission
+    with a cached kernel matrix), "validate" (fft compared with simps) or "adaptive"
+    (adaptiveConvolution to the relative tolerance rtol, which replaces lgintRes).'''
+    electronParams = (lgEmin, lgEb, lgEmax, p, dp, lgs, lgchi)
+    results = dict(_electronStage(*electronParams)[-1])
+    fullSyn, normSyn, synResults = _synchrotronStage(*electronParams, lgB, lgintRes, method, rtol)
+    results.update(synResults)
 
-    results["Eelvis"] = list(np.log10(x_vis_list*erg2eV))
+    Ephs = _photonGrid(lgEmin, lgEmax, lgB)
+    x_vis_list, vis = _visualStage(*electronParams, lgB, lgEelDelta, NvisEl)
+    results["Eelvis"] = np.log10(x_vis_list*erg2eV)
     for i in range(NvisEl):
-        results[f"Ephvis_{i}"] = list(np.log10(Ephs**(2) * vis[i] / normSyn + 1e-30))
-    
-    return json.dumps(results)
\ No newline at end of file
+        results[f"Ephvis_{i}"] = np.log10(Ephs**(2) * vis[i] / normSyn + 1e-30)
+
+    return Result(results)
+
+
+def calcSyn_batch(params, Ephs=None, per_decade=128, rows_per_chunk=256, bounds=None):
+    '''Synchrotron spectra of many parameter sets at once, as raw arrays for scans and fits.
+
+    The kernel depends on B only through E_photon/B, so one kernel matrix on a grid of
+    electron energies and E_photon/B serves all rows: the spectra of a chunk of rows are a
+    single matrix product, interpolated in log-log to E_photon/B of each row.
+
+    Args:
+        params (ndarray[N, 11]): rows of the arguments of calcSyn, lgEmin, lgEb, lgEmax, p,
+            dp, lgs, lgchi, lgB, lgEelDelta, NvisEl, lgintRes. lgEelDelta and NvisEl are
+            not used; the electron grid has 10**lgintRes points per decade (largest row).
+        Ephs (ndarray, optional): photon energies in erg shared by all rows. Defaults to the
+            photon grid of calcSyn of each row.
+        per_decade (int, optional): points per decade of the E_photon/B grid.
+        rows_per_chunk (int, optional): rows per matrix product, bounds the memory.
+        bounds (tuple, optional): (Eintmin, Eintmax, Eph_B_min, Eph_B_max) in erg and erg/G,
+            fixes the electron and E_photon/B grids instead of fitting them to the rows.
+            The kernel matrix of a grid is cached, so calls with the same bounds and
+            resolution, e.g. the iterations of a fit, reuse it.
+
+    Returns:
+        photon energies in erg and the spectra fullSyn of calcSyn (not normalised), both
+        of shape (N, len(Ephs)).
+    '''
+    params = np.atleast_2d(np.asarray(params, dtype=float))
+    lgEmin, lgEb, lgEmax, p, dp, lgs, lgchi, lgB, _, _, lgintRes = (
+        params[:, i:i + 1] for i in range(11))
+    Emin = 10**lgEmin * eV2erg
+    Eb = 10**lgEb*eV2erg
+    Emax = 10**lgEmax * eV2erg
+    s = 10**lgs
+    chi = 10**lgchi
+    B = 10**lgB
+    Eintmin = np.maximum(1e-1*Emin, mec2)
+    Eintmax = 1e2*Emax
+    if Ephs is None:
+        lo = np.maximum(np.log10(Esyn(Emin, B))-5, np.log10(1e-9*eV2erg))
+        hi = np.log10(Esyn(Emax, B))+3
+        Ephs = 10**(lo + (hi - lo)*np.linspace(0, 1, 200))
+    Ephs = np.broadcast_to(Ephs, (len(params), np.shape(Ephs)[-1]))
+
+    # common electron grid, with the weights of the trapezoidal rule cut at the integration
+    # range of each row: the integrals of the hat functions of the nodes over that range
+    if bounds is None:
+        bounds = (np.min(Eintmin), np.max(Eintmax), np.min(Ephs/B), np.max(Ephs/B))
+    u_min, u_max, ln_min, ln_max = np.log(np.asarray(bounds, dtype=float))
+    N_u = int(np.log10(np.exp(u_max - u_min)) * 10**np.max(lgintRes)) + 1
+    N_red = max(int(np.ceil((ln_max - ln_min)/np.log(10)*per_decade)), 1) + 1
+    u, kernel = _batchKernel(u_min, u_max, N_u, ln_min, ln_max, N_red)
+    du = u[1] - u[0]
+    d_ln = max(ln_max - ln_min, 1e-12)/(N_red - 1)
+    E_el = np.exp(u)
+    def hat_integral(t):
+        t = np.clip(t, -1, 1)
+        return np.where(t < 0, (t + 1)**2/2, 1 - (1 - t)**2/2)
+    weights = du*(hat_integral((np.log(Eintmax) - u)/du) - hat_integral((np.log(Eintmin) - u)/du))
+
+    ln_reduced = np.log(Ephs/B)
+    fullSyn = np.empty(Ephs.shape)
+    tiny = np.finfo(float).tiny
+    for start in range(0, len(params), rows_per_chunk):
+        rows = slice(start, start + rows_per_chunk)
+        Nel = (sbpl(E_el, 1, Emin[rows], p[rows], dp[rows], Eb[rows], s[rows])
+               * np.exp(-(E_el/Emax[rows])**chi[rows]) * np.exp(-(Emin[rows]/E_el)**chi[rows]))
+        lnF = np.log(np.maximum((weights[rows]*E_el*Nel) @ kernel.T, tiny))
+        # linear interpolation of ln F in ln(E_photon/B)
+        position = (ln_reduced[rows] - ln_min)/d_ln
+        k = np.clip(position.astype(int), 0, N_red - 2) if N_red > 1 else np.zeros(position.shape, int)
+        w = position - k
+        row_index = np.arange(lnF.shape[0])[:, None]
+        upper = lnF[row_index, np.minimum(k + 1, N_red - 1)]
+        fullSyn[rows] = np.exp((1 - w)*lnF[row_index, k] + w*upper)
+    return np.array(Ephs), fullSyn
+
+
+@lru_cache(maxsize=4)
+def _batchKernel(u_min, u_max, N_u, ln_min, ln_max, N_red):
+    "ln E_electron grid and kernel matrix of calcSyn_batch on the E_photon/B grid, read-only."
+    u = np.linspace(u_min, u_max, N_u)
+    d_ln = max(ln_max - ln_min, 1e-12)/(N_red - 1)
+    kernel = Kernel_Syn_tab(np.exp(u)[None, :], np.exp(ln_min + d_ln*np.arange(N_red))[:, None], 1)
+    return _readonly(u, kernel)
@@ -0,0 +1,136 @@
+import numpy as np
+from scipy.optimize import least_squares
+# from synchrotronCalc import calcSyn_batch, _photonGrid
+# import physicsConsts as c
+# from backend_common.result import Result
+
+# fitted parameters of calcSyn with the ranges of their sliders
+FIT_PARAMS = ("lgEmin", "lgEb", "lgEmax", "p", "dp", "lgs", "lgchi", "lgB")
+FIT_BOUNDS = ((7, 15), (7, 15), (7, 15), (0, 5), (-3, 5), (-2, 2), (-2, 2), (-5, 2))
+# finite difference step of all parameters
+FIT_STEP = 1e-2
+# error of lg E^2 dN/dE if the SED has no error column
+FIT_DEFAULT_ERR = 0.1
+
+
+def parseSED(text):
+    '''Reads a measured photon SED from text with the columns E [eV], E^2 dN/dE (any
+    units) and optionally the 1 sigma error of E^2 dN/dE, separated by whitespace,
+    commas or semicolons. Lines starting with # or not starting with a number (headers)
+    are skipped, as are points with non-positive values.
+
+    Returns:
+        lg E [eV], lg E^2 dN/dE and the errors of lg E^2 dN/dE, sorted by energy.
+    '''
+    rows = []
+    for line in text.splitlines():
+        fields = line.split("#")[0].replace(",", " ").replace(";", " ").split()
+        try:
+            values = [float(field) for field in fields[:3]]
+        except ValueError:
+            continue
+        if len(values) >= 2:
+            rows.append(values + [np.nan]*(3 - len(values)))
+    if not rows:
+        raise ValueError("SED has no rows with at least two numeric columns.")
+    E, flux, err = np.array(rows).T
+    err = np.where(np.isfinite(err) & (err > 0), err/(flux*np.log(10)), FIT_DEFAULT_ERR)
+    keep = (E > 0) & (flux > 0)
+    order = np.argsort(E[keep])
+    return np.log10(E[keep])[order], np.log10(flux[keep])[order], err[keep][order]
+
+
+def _profiledResiduals(lgModel, lgF, lgErr):
+    '''Weighted residuals of models (rows of lgModel) in lg E^2 dN/dE, each shifted by its
+    best-fitting normalisation, which is linear in lg and hence solved exactly.'''
+    weights = lgErr**-2
+    lgNorm = np.sum(weights*(lgF - lgModel), axis=-1, keepdims=True)/np.sum(weights)
+    return (lgModel + lgNorm - lgF)/lgErr, lgNorm[..., 0]
+
+
+def fitSynParams(lgE, lgF, lgErr, initial, lgintRes=1, free=FIT_PARAMS[:-1], per_decade=128,
+                 **kwargs):
+    '''Least-squares fit of the electron spectrum of calcSyn to a photon SED.
+
+    The model spectra come from calcSyn_batch on one electron and E_photon/B grid that
+    covers the whole parameter range, so the kernel matrix is computed once and reused in
+    every iteration. The Jacobian is a forward difference whose perturbed parameter sets
+    are evaluated in one batched call. The normalisation is not a parameter, it is
+    profiled out of the residuals.
+
+    B is fixed by default: the synchrotron spectrum depends on the electron energies only
+    through B E^2, so B and the electron energies are degenerate up to the E >= mec2 cut.
+
+    Args:
+        lgE, lgF, lgErr (ndarray): SED from parseSED.
+        initial (dict): start value of every parameter in FIT_PARAMS. Parameters that are
+            not free stay at this value.
+        lgintRes (float, optional): lg of the electron grid points per decade.
+        free (tuple, optional): names of the fitted parameters. Defaults to all but lgB.
+        per_decade (int, optional): points per decade of the E_photon/B grid.
+        kwargs: passed on to scipy.optimize.least_squares.
+
+    Returns:
+        dict of the best-fit parameters, their lg normalisation "lgNorm", "chi2", the
+        degrees of freedom "dof" and the number of model evaluations "nfev".
+    '''
+    index = [FIT_PARAMS.index(name) for name in free]
+    lower, upper = np.array(FIT_BOUNDS, dtype=float).T
+    theta = np.array([initial[name] for name in FIT_PARAMS], dtype=float)
+    Ephs = 10**lgE * eV2erg
+
+    lgB_range = (lower[-1], upper[-1]) if "lgB" in free else (theta[-1], theta[-1])
+    bounds = (max(1e-1*10**lower[0]*eV2erg, mec2), 1e2*10**upper[2]*eV2erg,
+              Ephs[0]/10**lgB_range[1], Ephs[-1]/10**lgB_range[0])
+
+    def residuals(rows):
+        params = np.tile(theta, (len(rows), 1))
+        params[:, index] = rows
+        # lgEelDelta and NvisEl are not used by calcSyn_batch
+        params = np.column_stack([params, np.zeros((len(rows), 2)), np.full(len(rows), lgintRes)])
+        _, fullSyn = calcSyn_batch(params, Ephs, per_decade=per_decade, bounds=bounds)
+        lgModel = np.log10(Ephs**2*fullSyn + 1e-300)
+        return _profiledResiduals(lgModel, lgF, lgErr)
+
+    def fun(x):
+        return residuals(x[None, :])[0][0]
+
+    def jac(x):
+        # steps point inwards at the upper bounds
+        steps = np.where(x + FIT_STEP <= upper[index], FIT_STEP, -FIT_STEP)
+        r = residuals(np.vstack([x, x + np.diag(steps)]))[0]
+        return ((r[1:] - r[0])/steps[:, None]).T
+
+    margin = 1e-6*(upper[index] - lower[index])
+    x0 = np.clip(theta[index], lower[index] + margin, upper[index] - margin)
+    solution = least_squares(fun, x0, jac=jac, bounds=(lower[index], upper[index]), **kwargs)
+
+    theta[index] = solution.x
+    r, lgNorm = residuals(solution.x[None, :])
+    result = dict(zip(FIT_PARAMS, theta.tolist()))
+    result.update({"lgNorm": float(lgNorm[0]), "chi2": float(np.sum(r**2)),
+                   "dof": len(lgE) - len(index) - 1, "nfev": solution.nfev + solution.njev})
+    return result
+
+
+def fitSyn(sed, lgEmin, lgEb, lgEmax, p, dp, lgs, lgchi, lgB, lgintRes):
+    '''Fits calcSyn to the SED in the text sed (see parseSED), starting from the slider
+    values, and returns the data, the best-fit spectrum and the best-fit parameters as
+    "controls" for the sliders. lgB stays fixed, see fitSynParams.'''
+    if not sed:
+        return Result(message="no SED loaded")
+    lgE, lgF, lgErr = parseSED(sed)
+    initial = dict(zip(FIT_PARAMS, (lgEmin, lgEb, lgEmax, p, dp, lgs, lgchi, lgB)))
+    best = fitSynParams(lgE, lgF, lgErr, initial, lgintRes)
+
+    params = [best[name] for name in FIT_PARAMS]
+    Ephs = _photonGrid(best["lgEmin"], best["lgEmax"], best["lgB"])
+    _, fullSyn = calcSyn_batch(params + [0, 0, lgintRes], Ephs)
+    return Result({
+        "xdata": lgE, "ydata": lgF,
+        "ydata_low": lgF - lgErr, "ydata_high": lgF + lgErr,
+        "xfit": np.log10(Ephs*erg2eV),
+        "yfit": np.log10(Ephs**2*fullSyn[0] + 1e-300) + best["lgNorm"],
+        "chi2": best["chi2"], "dof": best["dof"], "nfev": best["nfev"],
+        "controls": {name: round(best[name], 2) for name in FIT_PARAMS},
+        })
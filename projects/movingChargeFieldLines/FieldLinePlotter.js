@@ -17,9 +17,9 @@ export class FieldLinePlotter extends BaseColorPlotter {
     super.addOrUpdateLine("charge trajectory", result_dict.x_traj, result_dict.y_traj, {color: "grey", width: 3});
     super.addOrUpdateLine("charge position", result_dict.x_charge, result_dict.y_charge, {color: "#cec3c3f1", marker: ".", markersize: 6});
 
-    // max 50 = Nlines in config
-    for (let i = 0; i < 50; i++) {
-    //   console.log(i);
+    // remove the lines of a previous call with more field lines
+    const nLines = Math.max(this.nFieldLines || 0, result_dict.x_field_lines.length);
+    for (let i = 0; i < nLines; i++) {
       if (i<result_dict.x_field_lines.length) {
         super.addOrUpdateLine("field_line_" + i, 
             result_dict.x_field_lines[i], result_dict.y_field_lines[i], 
@@ -27,9 +27,8 @@ export class FieldLinePlotter extends BaseColorPlotter {
       } else {
         super.removeLine("field_line_" + i);
       }
-
-        
     }
+    this.nFieldLines = result_dict.x_field_lines.length;
     super.set_axis_limits(result_dict.X.at(0), result_dict.X.at(-1),
         result_dict.Y.at(0), result_dict.Y.at(-1));
   }
@@ -1,11 +1,11 @@
 import numpy as np
-# from charges import Charge
+# from charges import Oscillator
 # from field_calculations import MovingChargesField
 
 import scipy.constants as constants
 c = constants.c  # set speed of light constant
-import json
-from abc import ABC, abstractmethod
+from functools import lru_cache
+# from backend_common.result import Result
 
 
 # Constants
@@ -16,109 +16,14 @@ c = constants.c
 u_0 = constants.mu_0
 
 
-class Charge(ABC):
-
-    def __init__(self, pos_charge=True):
-        self.pos_charge = pos_charge
-
-    @abstractmethod
-    def xpos(self, t):
-        pass
-
-    @abstractmethod
-    def ypos(self, t):
-        pass
-
-    @abstractmethod
-    def zpos(self, t):
-        pass
-
-    @abstractmethod
-    def xvel(self, t):
-        pass
-
-    @abstractmethod
-    def yvel(self, t):
-        pass
-
-    @abstractmethod
-    def zvel(self, t):
-        pass
-
-    @abstractmethod
-    def xacc(self, t):
-        pass
-
-    @abstractmethod
-    def yacc(self, t):
-        pass
-
-    @abstractmethod
-    def zacc(self, t):
-        pass
-    
-    def xytheta(self, t):
-        return np.arctan2(self.yvel(t), self.xvel(t))
-    
-    def xytheta_dot(self, t):
-        derivative = (self.xvel(t)*self.yacc(t) - self.yvel(t)*self.xacc(t)) / (self.xvel(t)**2 + self.yvel(t)**2)
-        return np.nan_to_num(derivative)
-
-    def retarded_time(self, tr, t, X, Y, Z):
-        """Returns equation to solve for retarded time - Griffiths Eq. 10.55"""
-        return ((X-self.xpos(tr))**2 + (Y-self.ypos(tr))**2 + (Z-self.zpos(tr))**2)**0.5 - c*(t-tr)
-
-
-class Oscillator(Charge):
-
-    def __init__(self, pos_charge=True, center=(0, 0, 0),
-                 amplitude=(1e-9, 1e-9), max_speed=0.9*c, phase=0):
-        super().__init__(pos_charge)
-        self.center = np.array(center)
-        self.amplitude = np.array(amplitude)
-        self.phase = phase
-        # beta_max = beta(t_max), with beta_dot(t_max) = 0
-        Ax, Ay = self.amplitude
-        self.wt_max = 1/2 * np.arctan2(-Ay**2*np.sin(2*phase), Ax**2 + Ay**2*np.cos(2*phase))
-        # print("wtmax", -Ay**2*np.sin(2*phase), Ax**2 + Ay**2*np.cos(2*phase))
-        self.w = max_speed / np.sqrt(Ax**2 * np.cos(self.wt_max)**2 + Ay**2 * np.cos(self.wt_max + phase)**2)
-        # print("w", self.w)
-
-    def xpos(self, t):
-        return self.center[0] + self.amplitude[0]*np.sin(self.w*t)
-    
-    def ypos(self, t):
-        return self.center[1] + self.amplitude[1]*np.sin(self.w*t + self.phase)
-
-    def zpos(self, t):
-        return self.center[2] * np.ones(t.shape)
-    
-    def xvel(self, t):
-        return self.w*self.amplitude[0]*np.cos(self.w*t)
-    
-    def yvel(self, t):
-        return self.w*self.amplitude[1]*np.cos(self.w*t + self.phase)
-    
-    def zvel(self, t):
-        return 0 * t
-
-    def xacc(self, t):
-        return - self.w**2*self.amplitude[0]*np.sin(self.w*t)
-
-    def yacc(self, t):
-        return - self.w**2*self.amplitude[1]*np.sin(self.w*t + self.phase)
-
-    def zacc(self, t):
-        return 0 * t
-
-    def get_period(self):
-        return 2*np.pi/self.w
-    
-
-def calcFieldLines(ti, lgbG, frac_Ax_lim, frac_Ay_lim, resolution, Nlines, lgfmax):
+@lru_cache(maxsize=4)
+def _scene(lgbG, frac_Ax_lim, frac_Ay_lim, resolution):
+    """Grid, charge and field for one set of non-time parameters.
 
+    Cached, so that moving the time slider reuses the same field object and its
+    retarded time solutions warm start the next time slice.
+    """
     bG = 10**lgbG
-    fmax = 10**lgfmax
 
     Nts = 100
     lim = 1e8  # m
@@ -126,34 +31,107 @@ def calcFieldLines(ti, lgbG, frac_Ax_lim, frac_Ay_lim, resolution, Nlines, lgfma
     x1d = np.linspace(-lim, lim, grid_size)
     y1d = np.linspace(-lim, lim, grid_size)
     X, Y, Z = np.meshgrid(x1d, y1d, 0, indexing='ij')
-    
 
     beta = np.sqrt(1- 1/(1 + bG**2))
     charge = Oscillator(center=(-lim * 3/4, 0, 0), amplitude=(frac_Ax_lim*lim/4, frac_Ay_lim*lim/4), max_speed= beta*c, phase=0.5*np.pi)
     field = MovingChargesField(charge, h=1e-4)
 
     ts = np.linspace(0, 2*np.pi/charge.w, Nts)
+    return lim, x1d, y1d, X, Y, Z, charge, field, ts
+
+
+@lru_cache(maxsize=2)
+def _period_Eabs(lgbG, frac_Ax_lim, frac_Ay_lim, resolution):
+    """Field amplitude of all time slices of a scene, shape (Nts, y, x).
+
+    Computed in vectorized passes over (time, x, y) and cached on the non-time
+    parameters, so that moving the time slider becomes a lookup.
+    """
+    lim, x1d, y1d, X, Y, Z, charge, field, ts = _scene(lgbG, frac_Ax_lim, frac_Ay_lim, resolution)
+    Ex, Ey, _ = field.calculate_E_frames(ts, X, Y, Z, pcharge_field='Total', plane=True)
+    Eabs = np.nan_to_num((Ex**2 + Ey**2)**0.5).transpose(0, 2, 1)
+    Eabs.flags.writeable = False
+    return Eabs
+
+
+def _thin_field_lines(us, vs, ds_max, max_turn=0.1):
+    """Keeps the points where a field line has turned by max_turn or advanced by ds_max
+    since the last kept point, so that straight stretches cost few points.
+
+    Returns:
+        lists of the x and y values (arrays) of each field line.
+    """
+    du = np.diff(us, axis=1)
+    dv = np.diff(vs, axis=1)
+    turn = np.abs(np.arctan2(du[:, 1:]*dv[:, :-1] - dv[:, 1:]*du[:, :-1],
+                             du[:, 1:]*du[:, :-1] + dv[:, 1:]*dv[:, :-1]))
+    cost = np.cumsum(np.hypot(du, dv)/ds_max, axis=1)
+    cost[:, 1:] += np.cumsum(turn/max_turn, axis=1)
+    keep = np.ones(us.shape, dtype=bool)
+    keep[:, 1:-1] = np.diff(np.floor(cost), axis=1) > 0
+    return ([u[k] for u, k in zip(us, keep)],
+            [v[k] for v, k in zip(vs, keep)])
+
+
+def calcFieldLines(ti, lgbG, frac_Ax_lim, frac_Ay_lim, resolution, Nlines, lgfmax, whole_period=0,
+                   refine_levels=0):
+
+    lim, x1d, y1d, X, Y, Z, charge, field, ts = _scene(lgbG, frac_Ax_lim, frac_Ay_lim, resolution)
     t = ts[ti]
-    
-    E_total = field.calculate_E(t=t, X=X, Y=Y, Z=Z, pcharge_field='Total', plane=True)
-    Eabs = (E_total[0].T**2 + E_total[1].T**2)**0.5
-
-    if Nlines > 0:
-        us, vs, alphas, sol = field.calculate_FieldLines_Tsien(ts[ti], fmax*lim, Nlines=Nlines, Nintsteps=1000)
-        x_field_lines = charge.xpos(t-sol.t[:, None]/c) + sol.t[:, None] * np.cos(charge.xytheta(t-sol.t[:, None]/c) + sol.y.T)
-        y_field_lines = charge.ypos(t-sol.t[:, None]/c) + sol.t[:, None] * np.sin(charge.xytheta(t-sol.t[:, None]/c) + sol.y.T)
+
+    if whole_period:
+        Eabs = _period_Eabs(lgbG, frac_Ax_lim, frac_Ay_lim, resolution)[ti]
+    elif refine_levels > 0:
+        # starts on a 2**refine_levels coarser grid and refines where |E| is not smooth
+        Eabs, _ = field.calculate_Eabs_adaptive(t, x1d, y1d, levels=int(refine_levels))
+        Eabs = np.nan_to_num(Eabs.T)
     else:
-        x_field_lines = np.array([])
-        y_field_lines = np.array([])
+        E_total = field.calculate_E(t=t, X=X, Y=Y, Z=Z, pcharge_field='Total', plane=True)
+        Eabs = np.nan_to_num((E_total[0].T**2 + E_total[1].T**2)**0.5)
+
+    x_field_lines, y_field_lines = _field_lines(lgbG, frac_Ax_lim, frac_Ay_lim, resolution, ti,
+                                                Nlines, lgfmax)
+    return _result(x1d, y1d, Eabs, charge, ts, ti, x_field_lines, y_field_lines)
+
+
+def calcFieldLines_progressive(ti, lgbG, frac_Ax_lim, frac_Ay_lim, resolution, Nlines, lgfmax,
+                               whole_period=0, refine_levels=0, coarsest=25):
+    """Yields the results of calcFieldLines from coarse to fine grids, so that a picture
+    is shown at once and sharpens level by level. The coarsest level has about
+    coarsest cells along each axis, and every finer level starts its retarded time
+    solve from the previous one. Precomputed and adaptive maps are yielded at once.
+    """
+    if whole_period or refine_levels > 0 or resolution - 1 < 2*coarsest:
+        yield calcFieldLines(ti, lgbG, frac_Ax_lim, frac_Ay_lim, resolution, Nlines, lgfmax,
+                             whole_period, refine_levels)
+        return
+
+    lim, x1d, y1d, X, Y, Z, charge, field, ts = _scene(lgbG, frac_Ax_lim, frac_Ay_lim, resolution)
+    x_field_lines, y_field_lines = _field_lines(lgbG, frac_Ax_lim, frac_Ay_lim, resolution, ti,
+                                                Nlines, lgfmax)
+    levels = int(np.log2((resolution - 1)/coarsest))
+    for i, j, E_total in field.calculate_E_progressive(ts[ti], x1d, y1d, levels=levels):
+        Eabs = np.nan_to_num((E_total[0].T**2 + E_total[1].T**2)**0.5)
+        yield _result(x1d[i], y1d[j], Eabs, charge, ts, ti, x_field_lines, y_field_lines)
+
+
+def _field_lines(lgbG, frac_Ax_lim, frac_Ay_lim, resolution, ti, Nlines, lgfmax):
+    "Field lines of the scene at time slice ti, thinned for plotting."
+    if Nlines <= 0:
+        return [], []
+    lim, x1d, y1d, X, Y, Z, charge, field, ts = _scene(lgbG, frac_Ax_lim, frac_Ay_lim, resolution)
+    fmax = 10**lgfmax
+    us, vs, alphas, Rs = field.calculate_FieldLines_Tsien(ts[ti], fmax*lim, Nlines=Nlines)
+    return _thin_field_lines(us, vs, ds_max=2*lim/100)
 
 
-    return json.dumps({
+def _result(x1d, y1d, Eabs, charge, ts, ti, x_field_lines, y_field_lines):
+    return Result({
         # 2D colormap
-        "X": (x1d).tolist(), "Y": (y1d).tolist(), "Z": np.nan_to_num(Eabs).tolist(),
+        "X": x1d, "Y": y1d, "Z": Eabs,
         # trajectory
-        "x_charge": [charge.xpos(ts[ti])], "y_charge": [charge.ypos(ts[ti])],
-        "x_traj": (charge.xpos(ts)).tolist(), "y_traj": (charge.ypos(ts)).tolist(),
-        "x_field_lines": x_field_lines.T.tolist(),
-        "y_field_lines": y_field_lines.T.tolist()
+        "x_charge": np.atleast_1d(charge.xpos(ts[ti])), "y_charge": np.atleast_1d(charge.ypos(ts[ti])),
+        "x_traj": charge.xpos(ts), "y_traj": charge.ypos(ts),
+        "x_field_lines": x_field_lines,
+        "y_field_lines": y_field_lines
         })
-
@@ -0,0 +1,139 @@
+"""ChargeEnsemble class groups point charges of the same class and stores their
+parameters as arrays, one row per charge. The kinematics and retarded times of
+all charges of an ensemble are then evaluated in one broadcasted pass over an
+(N_charges, grid) array instead of one pass per charge.
+"""
+import numbers
+
+import numpy as np
+
+
+class ChargeEnsemble():
+
+    def __init__(self, charges):
+        """Ensemble of point charges of one Charge class.
+
+        Numeric attributes of the charges (floats and numeric arrays) become parameter
+        arrays with one row per charge. All other attributes (flags such as start_zero,
+        or None) must be equal for all charges, since they select code paths.
+
+        Args:
+            charges (list of :obj: Charge): Point charges of the same class.
+        """
+        self.charges = list(charges)
+        self.charge_class = type(self.charges[0])
+        if any(type(charge) is not self.charge_class for charge in self.charges):
+            raise ValueError("All charges of a ChargeEnsemble must be of the same class.")
+        self.shared, numeric = _split_attributes(self.charges[0])
+        for charge in self.charges[1:]:
+            if _split_attributes(charge)[0] != self.shared:
+                raise ValueError("Non-numeric attributes differ between charges of the ensemble.")
+        self.params = {name: np.array([vars(charge)[name] for charge in self.charges], dtype=float)
+                       for name in numeric}
+        self.signs = np.array([1. if charge.pos_charge else -1. for charge in self.charges])
+        self._chunks = {}
+
+    def __len__(self):
+        return len(self.charges)
+
+    @staticmethod
+    def group(charges):
+        """Groups charges into ChargeEnsembles of compatible charges.
+
+        Charges without a compatible partner are returned unchanged.
+
+        Args:
+            charges (list of :obj: Charge): Point charges.
+
+        Returns:
+            list of :obj: Charge and :obj: ChargeEnsemble, in order of first occurrence.
+        """
+        groups = {}
+        for charge in charges:
+            shared, numeric = _split_attributes(charge)
+            key = (type(charge), repr(sorted(shared.items())), tuple(numeric))
+            groups.setdefault(key, []).append(charge)
+        return [ChargeEnsemble(members) if len(members) > 1 else members[0]
+                for members in groups.values()]
+
+    def chunks(self, size):
+        """Splits the ensemble into ensembles of at most size charges. The split is
+        memoized, so repeated calls return the same objects."""
+        size = max(int(size), 1)
+        if size >= len(self):
+            return [self]
+        if size not in self._chunks:
+            self._chunks[size] = [ChargeEnsemble(self.charges[i:i + size]) if size > 1
+                                  else self.charges[i]
+                                  for i in range(0, len(self), size)]
+        return self._chunks[size]
+
+    def stacked(self, ndim):
+        """Returns an instance of the charge class whose parameters broadcast along a
+        leading charge axis against arrays with ndim further dimensions."""
+        return self._proxy(lambda values: values.reshape(
+            values.shape[:1] + (1,)*ndim + values.shape[1:]))
+
+    def pointwise(self, charge_index):
+        """Returns an instance of the charge class with the parameters of the charge
+        charge_index[i] at flattened point i."""
+        return self._proxy(lambda values: values[charge_index])
+
+    def _proxy(self, take):
+        proxy = object.__new__(self.charge_class)
+        vars(proxy).update(self.shared)
+        for name, values in self.params.items():
+            value = take(values)
+            if values.ndim > 1:
+                # vector parameters are indexed by component first, e.g. center[0]
+                value = np.moveaxis(value, -1, 0)
+            setattr(proxy, name, value)
+        return proxy
+
+    def sign(self, ndim):
+        "Charge signs (+1 or -1) broadcasting along the leading charge axis."
+        return self.signs.reshape((-1,) + (1,)*ndim)
+
+    def broadcast_grid(self, X, Y, Z):
+        "Broadcasts the grid to (N_charges,) + grid shape."
+        shape = (len(self),) + np.broadcast(X, Y, Z).shape
+        return tuple(np.broadcast_to(A, shape) for A in (X, Y, Z))
+
+    def kinematics(self, t):
+        """Returns position, velocity and acceleration of all charges.
+
+        Args:
+            t (:obj: ndarray(float)): Times with a leading charge axis, shape (N_charges, ...).
+        """
+        return self.stacked(np.ndim(t) - 1).kinematics(t)
+
+    def solve_retarded_time(self, t, X, Y, Z):
+        """Closed-form retarded times of all charges, or None if the charge class has none.
+
+        Args:
+            X, Y, Z (:obj: ndarray(float)): Grid with a leading charge axis, see broadcast_grid.
+        """
+        return self.charge_class.solve_retarded_time(self.stacked(np.ndim(X) - 1), t, X, Y, Z)
+
+
+def _split_attributes(charge):
+    """Splits the attributes of a charge into non-numeric ones (returned as dict) and the
+    names of numeric ones. pos_charge is handled as sign by the ensemble."""
+    shared = {}
+    numeric = []
+    for name, value in vars(charge).items():
+        if name == "pos_charge":
+            continue
+        if _is_numeric(value):
+            numeric.append(name)
+        else:
+            shared[name] = value
+    return shared, numeric
+
+
+def _is_numeric(value):
+    if isinstance(value, (bool, np.bool_)):
+        return False
+    if isinstance(value, np.ndarray):
+        return value.dtype.kind in "iuf"
+    return isinstance(value, numbers.Real)
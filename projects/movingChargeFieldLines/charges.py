@@ -1,7 +1,7 @@
 """Classes of charges used for the MovingChargesField class.
 Charge class is abstract class for LinearAcceleratingCharge, 
 LinearDeceleratingCharge, LinearVelocityCharge, OrbittingCharge, 
-and OscillatingCharge classes.
+OscillatingCharge, OscillatingOrbittingCharge and Oscillator classes.
 """
 import numpy as np
 from abc import ABC, abstractmethod
@@ -56,17 +56,46 @@ class Charge(ABC):
     def zacc(self, t):
         pass
     
+    def kinematics(self, t):
+        """Returns position, velocity and acceleration at time t from one evaluation.
+
+        Subclasses override it to share trigonometric terms and masks between the
+        components; this default calls the individual component methods.
+
+        Args:
+            t (float or ndarray): Time in seconds.
+
+        Returns:
+            tuple of ((x, y, z), (vx, vy, vz), (ax, ay, az)) ndarrays with the shape of t.
+        """
+        shape = np.shape(t)
+        return (
+            tuple(np.broadcast_to(f(t), shape) for f in (self.xpos, self.ypos, self.zpos)),
+            tuple(np.broadcast_to(f(t), shape) for f in (self.xvel, self.yvel, self.zvel)),
+            tuple(np.broadcast_to(f(t), shape) for f in (self.xacc, self.yacc, self.zacc)),
+        )
+
     def xytheta(self, t):
         return np.arctan2(self.yvel(t), self.xvel(t))
     
     def xytheta_dot(self, t):
-        derivative = (self.xvel(t)*self.yacc(t) - self.yvel(t)*self.xacc(t)) / (self.xvel(t)**2 + self.yvel(t)**2)
+        _, (vx, vy, _), (ax, ay, _) = self.kinematics(t)
+        derivative = (vx*ay - vy*ax) / (vx**2 + vy**2)
         return np.nan_to_num(derivative)
 
     def retarded_time(self, tr, t, X, Y, Z):
         """Returns equation to solve for retarded time - Griffiths Eq. 10.55"""
         return ((X-self.xpos(tr))**2 + (Y-self.ypos(tr))**2 + (Z-self.zpos(tr))**2)**0.5 - c*(t-tr)
 
+    def solve_retarded_time(self, t, X, Y, Z):
+        """Returns the closed-form retarded time at the grid points, or None if the
+        charge has none. Points without a solution are NaN.
+
+        MovingChargesField uses it when available and falls back to the numeric
+        RetardedTimeSolver otherwise.
+        """
+        return None
+
 
 class OscillatingCharge(Charge):
 
@@ -162,6 +191,28 @@ class OscillatingCharge(Charge):
             zacc[t > self.stop_t] = 0
         return zacc
 
+    def kinematics(self, t):
+        cos_wt = np.cos(self.w*t)
+        displacement = self.amplitude*(1-cos_wt)
+        speed = self.amplitude*self.w*np.sin(self.w*t)
+        acceleration = self.amplitude*self.w**2*cos_wt
+        halted = False
+        if self.start_zero:
+            halted = t < 0
+            displacement = np.where(halted, 0, displacement)
+        if self.stop_t is not None:
+            stopped = t > self.stop_t
+            halted = halted | stopped
+            displacement = np.where(stopped, self.amplitude*(1-np.cos(self.w*self.stop_t)),
+                                    displacement)
+        speed = np.where(halted, 0, speed)
+        acceleration = np.where(halted, 0, acceleration)
+        return (
+            tuple(self.start_position[i] + self.direction[i]*displacement for i in range(3)),
+            tuple(self.direction[i]*speed for i in range(3)),
+            tuple(self.direction[i]*acceleration for i in range(3)),
+        )
+
     def get_period(self):
         return 2*np.pi/self.w
 
@@ -222,6 +273,23 @@ class OrbittingCharge(Charge):
     def zacc(self, t):
         return 0
 
+    def kinematics(self, t):
+        cos_phi = np.cos(self.w*t+self.phase)
+        sin_phi = np.sin(self.w*t+self.phase)
+        zero = np.zeros(np.shape(cos_phi))
+        if self.start_zero:
+            before = t < 0
+            pos = (np.where(before, self.amplitude*np.cos(self.phase), self.amplitude*cos_phi),
+                   np.where(before, self.amplitude*np.sin(self.phase), self.amplitude*sin_phi),
+                   zero)
+            cos_phi = np.where(before, 0, cos_phi)
+            sin_phi = np.where(before, 0, sin_phi)
+        else:
+            pos = (self.amplitude*cos_phi, self.amplitude*sin_phi, zero)
+        vel = (-self.amplitude*self.w*sin_phi, self.amplitude*self.w*cos_phi, zero)
+        acc = (-self.amplitude*self.w**2*cos_phi, -self.amplitude*self.w**2*sin_phi, zero)
+        return pos, vel, acc
+
     def get_period(self):
         return 2*np.pi/self.w
 
@@ -288,6 +356,24 @@ class OscillatingOrbittingCharge(Charge):
     def zacc(self, t):
         return 0
 
+    def kinematics(self, t):
+        cos_wt = np.cos(t*self.w)
+        sin_wt = np.sin(t*self.w)
+        cos_phi = np.cos(self.A*cos_wt+self.phase)
+        sin_phi = np.sin(self.A*cos_wt+self.phase)
+        zero = np.zeros(np.shape(cos_wt))
+        pos = (self.radius*cos_phi, self.radius*sin_phi, zero)
+        vel = (self.max_speed*sin_wt*sin_phi, -self.max_speed*sin_wt*cos_phi, zero)
+        acc = (self.max_speed*self.w*(cos_wt*sin_phi - self.A*sin_wt**2*cos_phi),
+               -self.max_speed*self.w*(cos_wt*cos_phi + self.A*sin_wt**2*sin_phi), zero)
+        if self.start_zero:
+            before = t < 0
+            pos = (np.where(before, self.radius*np.cos(self.phase), pos[0]),
+                   np.where(before, self.radius*np.sin(self.phase), pos[1]), zero)
+            vel = tuple(np.where(before, 0, component) for component in vel)
+            acc = tuple(np.where(before, 0, component) for component in acc)
+        return pos, vel, acc
+
     def get_period(self):
         return 2*np.pi/self.w
 
@@ -340,6 +426,26 @@ class LinearAcceleratingCharge(Charge):
     def zacc(self, t):
         return 0
 
+    def kinematics(self, t):
+        a = self.acceleration
+        before = t < 0
+        after = t > self.stop_t
+        zero = np.zeros(np.shape(t))
+        xpos = np.where(before, 0, np.where(after, 0.5*a*self.stop_t**2 + a*self.stop_t*(t-self.stop_t),
+                                            0.5*a*t**2))
+        xvel = np.where(before, 0, np.where(after, a*self.stop_t, a*t))
+        xacc = np.where(before | after, 0, a*np.ones(np.shape(t)))
+        return (xpos, zero, zero), (xvel, zero, zero), (xacc, zero, zero)
+
+    def solve_retarded_time(self, t, X, Y, Z):
+        a = self.acceleration
+        pieces = [
+            (-np.inf, 0, 0, 0, 0),  # at rest before t = 0
+            (self.stop_t, np.inf, -0.5*a*self.stop_t**2, a*self.stop_t, 0),
+            (0, self.stop_t, 0, 0, a),
+        ]
+        return _piecewise_retarded_time(t, X, Y, Z, pieces)
+
 
 class LinearDeceleratingCharge(Charge):
     """Point charge decelerates in x direction starting at origin.."""
@@ -391,6 +497,26 @@ class LinearDeceleratingCharge(Charge):
     def zacc(self, t):
         return 0
 
+    def kinematics(self, t):
+        v0, d = self.initial_speed, self.deceleration
+        started = t > 0
+        after = t > self.stop_t
+        zero = np.zeros(np.shape(t))
+        xpos = np.where(after, v0*self.stop_t - 0.5*d*self.stop_t**2,
+                        np.where(started, v0*t - 0.5*d*t**2, v0*t))
+        xvel = np.where(after, 0, np.where(started, v0 - d*t, v0))
+        xacc = np.where(started & ~after, -d, zero)
+        return (xpos, zero, zero), (xvel, zero, zero), (xacc, zero, zero)
+
+    def solve_retarded_time(self, t, X, Y, Z):
+        v0, d = self.initial_speed, self.deceleration
+        pieces = [
+            (-np.inf, 0, 0, v0, 0),
+            (self.stop_t, np.inf, v0*self.stop_t - 0.5*d*self.stop_t**2, 0, 0),
+            (0, self.stop_t, 0, v0, -d),
+        ]
+        return _piecewise_retarded_time(t, X, Y, Z, pieces)
+
 
 class LinearVelocityCharge(Charge):
     """Point charge decelerates in x direction starting at origin.."""
@@ -426,3 +552,173 @@ class LinearVelocityCharge(Charge):
 
     def zacc(self, t):
         return 0
+
+    def kinematics(self, t):
+        zero = np.zeros(np.shape(t))
+        return ((self.speed*t + self.init_pos, zero, zero),
+                (self.speed + zero, zero, zero), (zero, zero, zero))
+
+    def solve_retarded_time(self, t, X, Y, Z):
+        return _piecewise_retarded_time(t, X, Y, Z, [(-np.inf, np.inf, self.init_pos, self.speed, 0)])
+
+
+class Oscillator(Charge):
+
+    def __init__(self, pos_charge=True, center=(0, 0, 0),
+                 amplitude=(1e-9, 1e-9), max_speed=0.9*c, phase=0):
+        super().__init__(pos_charge)
+        self.center = np.array(center)
+        self.amplitude = np.array(amplitude)
+        self.phase = phase
+        # beta_max = beta(t_max), with beta_dot(t_max) = 0
+        Ax, Ay = self.amplitude
+        self.wt_max = 1/2 * np.arctan2(-Ay**2*np.sin(2*phase), Ax**2 + Ay**2*np.cos(2*phase))
+        self.w = max_speed / np.sqrt(Ax**2 * np.cos(self.wt_max)**2 + Ay**2 * np.cos(self.wt_max + phase)**2)
+
+    def xpos(self, t):
+        return self.center[0] + self.amplitude[0]*np.sin(self.w*t)
+    
+    def ypos(self, t):
+        return self.center[1] + self.amplitude[1]*np.sin(self.w*t + self.phase)
+
+    def zpos(self, t):
+        return self.center[2] * np.ones(t.shape)
+    
+    def xvel(self, t):
+        return self.w*self.amplitude[0]*np.cos(self.w*t)
+    
+    def yvel(self, t):
+        return self.w*self.amplitude[1]*np.cos(self.w*t + self.phase)
+    
+    def zvel(self, t):
+        return 0 * t
+
+    def xacc(self, t):
+        return - self.w**2*self.amplitude[0]*np.sin(self.w*t)
+
+    def yacc(self, t):
+        return - self.w**2*self.amplitude[1]*np.sin(self.w*t + self.phase)
+
+    def zacc(self, t):
+        return 0 * t
+
+    def kinematics(self, t):
+        sin_wt = np.sin(self.w*t)
+        cos_wt = np.cos(self.w*t)
+        # angle addition instead of evaluating the phase shifted y terms
+        sin_y = sin_wt*np.cos(self.phase) + cos_wt*np.sin(self.phase)
+        cos_y = cos_wt*np.cos(self.phase) - sin_wt*np.sin(self.phase)
+        zero = np.zeros(np.shape(sin_wt))
+        pos = (self.center[0] + self.amplitude[0]*sin_wt,
+               self.center[1] + self.amplitude[1]*sin_y, self.center[2] + zero)
+        vel = (self.w*self.amplitude[0]*cos_wt, self.w*self.amplitude[1]*cos_y, zero)
+        acc = (-self.w**2*self.amplitude[0]*sin_wt, -self.w**2*self.amplitude[1]*sin_y, zero)
+        return pos, vel, acc
+
+    def get_period(self):
+        return 2*np.pi/self.w
+
+
+def _piecewise_retarded_time(t, X, Y, Z, pieces):
+    """Closed-form retarded time of a charge moving along the x axis.
+
+    Args:
+        t (float or ndarray): Time of simulation in seconds.
+        X, Y, Z (:obj: ndarray(float)): Coordinates of the field points in meters.
+        pieces (list of tuple): (tr_min, tr_max, x0, v, a) segments of the trajectory,
+            on which x(tr) = x0 + v*tr + a/2*tr**2. Segments with a = 0 are solved as
+            quadratic and should come first, so that the quartic of the accelerated
+            segments is only solved where needed.
+
+    Returns:
+        tr ndarray, NaN where no segment contains a solution.
+    """
+    t, X, rho2 = np.broadcast_arrays(np.asarray(t, dtype=float), X, Y**2 + Z**2)
+    tr = np.full(t.shape, np.nan)
+    for piece in pieces:
+        need = np.isnan(tr)
+        if not need.any():
+            break
+        # segment parameters may be arrays as well (ChargeEnsemble)
+        tr_min, tr_max, x0, v, a = (np.broadcast_to(value, t.shape)[need] for value in piece)
+        if np.all(a == 0):
+            tr_piece = _uniform_motion_retarded_time(t[need], X[need], rho2[need], x0, v)
+        else:
+            tr_piece = _accelerated_motion_retarded_time(t[need], X[need], rho2[need], x0, v, a,
+                                                         tr_min, tr_max)
+        tr[need] = np.where((tr_piece >= tr_min) & (tr_piece <= tr_max), tr_piece, np.nan)
+    return tr
+
+
+def _uniform_motion_retarded_time(t, X, rho2, x0, v):
+    """Retarded time for x(tr) = x0 + v*tr, the positive root tau = t - tr of
+    (dx + v*tau)**2 + rho2 = c**2*tau**2 with dx = X - x(t)."""
+    dx = X - (x0 + v*t)
+    d2 = dx**2 + rho2
+    dxv = dx*v
+    root = np.sqrt(dxv**2 + (c**2 - v**2)*d2)
+    # pick the form of the quadratic formula without cancellation
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tau = np.where(dxv >= 0, (dxv + root)/(c**2 - v**2), d2/(root - dxv))
+    return t - np.where(d2 > 0, tau, 0)
+
+
+def _accelerated_motion_retarded_time(t, X, rho2, x0, v, a, tr_min, tr_max):
+    """Retarded time for x(tr) = x0 + v*tr + a/2*tr**2 with tr_min <= tr <= tr_max.
+
+    With dx = X - x(t) and v_t = v + a*t, the light cone condition
+    (dx + v_t*tau - a/2*tau**2)**2 + rho2 = c**2*tau**2 is a quartic in tau = t - tr.
+    Written in w = T/tau, with T the light travel time of the distance at time t, it
+    is monic, so its roots follow from Ferrari's method. The root inside the segment
+    is polished with two Newton steps; NaN where there is none.
+    """
+    A = -0.5*a
+    B = v + a*t
+    C = X - (x0 + v*t + 0.5*a*t**2)
+    d2 = C**2 + rho2
+    T = np.sqrt(d2)/c
+    with np.errstate(divide='ignore', invalid='ignore'):
+        w = _monic_quartic_roots(2*B*C/(c**2*T), (B**2 + 2*A*C)/c**2 - 1,
+                                 2*A*B*T/c**2, (A*T/c)**2)
+        real = (np.abs(w.imag) <= 1e-6*np.abs(w)) & (w.real > 0)
+        tau = np.where(real, T/w.real, np.nan)
+        for _ in range(2):
+            u = C + B*tau + A*tau**2
+            tau = tau - (u**2 + rho2 - (c*tau)**2)/(2*u*(B + 2*A*tau) - 2*c**2*tau)
+        u = C + B*tau + A*tau**2
+        residual = np.abs(np.sqrt(u**2 + rho2) - c*tau)
+    tr_roots = t - tau
+    valid = ((tau >= 0) & (tr_roots >= tr_min) & (tr_roots <= tr_max)
+             & (residual <= 1e-9*(np.sqrt(d2) + c*tau)))
+    # the retarded time is unique for v < c, so take any valid root
+    tr = np.full(np.shape(t), np.nan)
+    for tr_root, ok in zip(tr_roots[::-1], valid[::-1]):
+        tr = np.where(ok, tr_root, tr)
+    return np.where(d2 > 0, tr, t)
+
+
+def _monic_quartic_roots(c3, c2, c1, c0):
+    """Roots of w**4 + c3*w**3 + c2*w**2 + c1*w + c0 with Ferrari's method.
+
+    Returns:
+        complex ndarray with the four roots along the first axis.
+    """
+    # depressed quartic y**4 + p*y**2 + q*y + r with w = y - c3/4
+    s = c3/4
+    p = c2 - 6*s**2
+    q = c1 - 2*c2*s + 8*s**3
+    r = c0 - c1*s + c2*s**2 - 3*s**4
+    # root m of the resolvent cubic m**3 + p*m**2 + (p**2/4 - r)*m - q**2/8 (Cardano)
+    P = -p**2/12 - r
+    Q = -p**3/108 + p*r/3 - q**2/8
+    root = np.sqrt(Q**2/4 + P**3/27 + 0j)
+    u3 = np.where(np.abs(-Q/2 + root) >= np.abs(-Q/2 - root), -Q/2 + root, -Q/2 - root)
+    u = u3**(1/3)
+    m = np.where(u != 0, u - P/(3*u), 0) - p/3
+    R = np.sqrt(2*m)
+    roots = []
+    for s1 in (1, -1):
+        D = np.sqrt(-(2*p + 2*m + s1*2*q/R))
+        for s2 in (1, -1):
+            roots.append((s1*R + s2*D)/2 - s)
+    return np.array(roots)
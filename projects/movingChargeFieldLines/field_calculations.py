@@ -1,13 +1,19 @@
 """ MovingChargesField class calculates both the electric and magnetic fields
 generated from moving point charges, as well as the respective scalar and
 vector potentials (in the Lorenz gauge). These are determined numerically at each
-grid point by determining the retarded time of each point charge. The Liénard–Wiechert
+grid point by determining the retarded time of each point charge with the
+RetardedTimeSolver. The Liénard–Wiechert
 potentials and corresponding E and B field equations are then evaluated.
 """
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 import numpy as np
 import scipy.constants as constants
-from scipy import optimize
-from scipy.integrate import solve_ivp
+# from retarded_time import RetardedTimeSolver
+# from charge_ensemble import ChargeEnsemble
 
 # Constants
 eps = constants.epsilon_0
@@ -16,23 +22,154 @@ pi = constants.pi
 e = constants.e
 c = constants.c
 
+# Approximate peak bytes of temporaries per (charge, grid point) pair
+_BYTES_PER_POINT = 8*48
+# Default number of (time, grid) points per pass of calculate_E_frames
+FRAME_POINTS = 2**14
+
 
 class MovingChargesField():
 
-    def __init__(self, charges, h=1e-20):
+    def __init__(self, charges, h=1e-20, maxiter=50, warm_start=True, warm_start_size=64,
+                 ensembles=True, ensemble_points=2**16, max_memory=None, workers=1,
+                 executor='thread', dtype=np.float64):
         """Determines the electric and magnetic fields (E and B) generated from
         moving point charge(s) at the specified time and grid points.
 
         Args:
             charges (list of :obj: Charge)): Point charge object(s) that generate the fields
-            h (float, optional): Tolerance for Newton's Method optimization. Defaults to 1e-20.
+            h (float, optional): Absolute tolerance of the retarded time solve in seconds.
+                Defaults to 1e-20.
+            maxiter (int, optional): Maximum number of Newton/bisection iterations of the
+                retarded time solve. Defaults to 50.
+            warm_start (bool, optional): Seed the retarded time solve with the last solution on
+                the same grid, shifted by the elapsed time. Defaults to True.
+            warm_start_size (int, optional): Maximum number of (charge, grid) retarded time
+                solutions kept for warm starts. Defaults to 64.
+            ensembles (bool, optional): Group compatible charges of the same class into
+                ChargeEnsembles that are evaluated in one broadcasted pass. Defaults to True.
+            ensemble_points (int, optional): Maximum number of (charge, grid point) pairs of one
+                broadcasted pass; larger ensembles are evaluated in chunks of charges, which
+                keeps the temporaries cache sized. Defaults to 2**16.
+            max_memory (int, optional): Approximate cap in bytes on the temporaries of the
+                field evaluation. Larger grids are evaluated in tiles of flattened grid points
+                (see TiledFieldSnapshot); the returned fields and the retarded times are not
+                included. Tiles re-evaluate the retarded kinematics for every requested
+                quantity, so tiling trades some speed for memory. Defaults to None (no tiling).
+            workers (int, optional): Number of tiles evaluated in parallel. Ignored under
+                Pyodide, which has no threads or processes. Defaults to 1.
+            executor (str, optional): 'thread' or 'process' pool for workers > 1. Threads
+                share the charges and work because numpy releases the GIL; processes need
+                picklable charge classes. Defaults to 'thread'.
+            dtype (:obj: numpy dtype, optional): float32 or float64 precision of the field
+                arithmetic and the returned fields. Retarded times are always solved in
+                float64. Defaults to float64.
         """
         try:
             len(charges)
         except TypeError:
             charges = [charges]
         self.charges = charges
-        self.h = h  # Causes overflow errors if too small
+        # sources are evaluated one at a time: single charges or ChargeEnsembles
+        self.sources = ChargeEnsemble.group(charges) if ensembles else list(charges)
+        self.ensemble_points = ensemble_points
+        self.max_memory = max_memory
+        self.workers = workers if sys.platform != 'emscripten' else 1
+        if executor not in ('thread', 'process'):
+            raise ValueError("executor must be 'thread' or 'process'.")
+        self.executor = executor
+        self._pool = None
+        self._lock = threading.Lock()
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in (np.float32, np.float64):
+            raise ValueError("dtype must be float32 or float64.")
+        self._workspaces = threading.local()
+        self.h = h
+        self.solver = RetardedTimeSolver(tol=h, maxiter=maxiter)
+        self.warm_start = warm_start
+        self.warm_start_size = warm_start_size
+        self._last_snapshot = None
+        self._tr_cache = OrderedDict()
+        # diagnostics of the last solve of each solved source and cumulative counts
+        self.last_info = {}
+        self.stats = {"solves": 0, "warm_solves": 0, "closed_form_solves": 0, "iterations": 0,
+                      "evaluations": 0, "unconverged": 0}
+
+    def snapshot(self, t, X, Y, Z):
+        """Returns the FieldSnapshot of the point charge(s) at time t on the grid.
+
+        The snapshot of the last call is kept, so that consecutive calls for the
+        same time and meshgrid arrays share one retarded time solution.
+
+        Args:
+            t (float): Time of simulation in seconds.
+            X (:obj: ndarray(float, ndim=3)): meshgrid of X values in meters.
+            Y (:obj: ndarray(float, ndim=3)): meshgrid of Y values in meters.
+            Z (:obj: ndarray(float, ndim=3)): meshgrid of Z values in meters.
+
+        Returns:
+            :obj: FieldSnapshot, or :obj: TiledFieldSnapshot if the grid is tiled.
+        """
+        snap = self._last_snapshot
+        if snap is None or not snap.matches(t, X, Y, Z):
+            tile_size = self._tile_size(np.broadcast(X, Y, Z).size)
+            if tile_size is None:
+                snap = FieldSnapshot(self, t, X, Y, Z)
+            else:
+                snap = TiledFieldSnapshot(self, t, X, Y, Z, tile_size)
+            self._last_snapshot = snap
+        return snap
+
+    def close(self):
+        "Shuts down the worker pool, if one was started."
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __getstate__(self):
+        # copies sent to worker processes start without caches, pool and statistics
+        state = self.__dict__.copy()
+        state.update(_last_snapshot=None, _tr_cache=OrderedDict(), _pool=None, _lock=None,
+                     _workspaces=None, last_info={}, stats=dict.fromkeys(self.stats, 0))
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._workspaces = threading.local()
+
+    def _workspace(self, shape):
+        "Returns the FieldWorkspace of the calling thread for arrays of the given shape."
+        workspaces = getattr(self._workspaces, 'by_shape', None)
+        if workspaces is None:
+            workspaces = self._workspaces.by_shape = OrderedDict()
+        workspace = workspaces.get(shape)
+        if workspace is None:
+            workspace = workspaces[shape] = FieldWorkspace(shape, self.dtype)
+            while len(workspaces) > 8:
+                workspaces.popitem(last=False)
+        workspaces.move_to_end(shape)
+        return workspace
+
+    def _tile_size(self, size):
+        "Number of flattened grid points per tile, or None if the grid is evaluated in one pass."
+        tile_size = size
+        if self.max_memory is not None:
+            # the retarded kinematics of all charges on a tile are alive at once
+            pairs = self.max_memory // (self.workers*_BYTES_PER_POINT)
+            tile_size = min(tile_size, max(pairs // len(self.charges), 1))
+        if self.workers > 1:
+            tile_size = min(tile_size, -(-size // self.workers))
+        return tile_size if tile_size < size else None
+
+    def _map(self, func, *iterables):
+        "Maps func over tiles, in the worker pool if workers > 1."
+        if self.workers <= 1:
+            return map(func, *iterables)
+        if self._pool is None:
+            pool_class = ThreadPoolExecutor if self.executor == 'thread' else ProcessPoolExecutor
+            self._pool = pool_class(self.workers)
+        return self._pool.map(func, *iterables)
 
     def calculate_E(self, t, X, Y, Z, pcharge_field='Total', plane=False):
         """Calculates the electric field E generated from the point charge(s).
@@ -50,28 +187,220 @@ class MovingChargesField():
             list of Ex, Ey, and Ez ndarrays which are 2 dimensional if plane is True, otherwise 3.
 
         """
-        t_array = np.ones((X.shape))
-        t_array[:, :, :] = t
-        Ex = np.zeros((X.shape))
-        Ey = np.zeros((X.shape))
-        Ez = np.zeros((X.shape))
-        for charge in self.charges:
-            # Determine retarded time of charge to calculate E
-            tr = optimize.newton(func=charge.retarded_time, x0=t_array,
-                                 args=(t_array, X, Y, Z), tol=self.h)
-            E_field = self._calculate_individual_E(
-                charge, tr, X, Y, Z, pcharge_field)
-            Ex += E_field[0]
-            Ey += E_field[1]
-            Ez += E_field[2]
-        if plane:
-            if X.shape[0] == 1:
-                return(Ex[0, :, :], Ey[0, :, :], Ez[0, :, :])
-            elif X.shape[1] == 1:
-                return(Ex[:, 0, :], Ey[:, 0, :], Ez[:, 0, :])
-            elif X.shape[2] == 1:
-                return(Ex[:, :, 0], Ey[:, :, 0], Ez[:, :, 0])
-        return (Ex, Ey, Ez)
+        E = self.snapshot(t, X, Y, Z).E(pcharge_field)
+        return _reduce_plane(E, X.shape) if plane else E
+
+    def calculate_E_frames(self, ts, X, Y, Z, pcharge_field='Total', plane=False):
+        """Calculates the electric field E at several times, e.g. all frames of a period.
+
+        The frames are evaluated in vectorized passes over (time, grid) arrays, with as
+        many frames per pass as fit into max_memory (or FRAME_POINTS points if unset).
+        The last frame of a pass warm starts the retarded time solve of the next pass.
+
+        Args:
+            ts (:obj: ndarray(float, ndim=1)): Times of simulation in seconds.
+            X (:obj: ndarray(float, ndim=3)): meshgrid of X values in meters.
+            Y (:obj: ndarray(float, ndim=3)): meshgrid of Y values in meters.
+            Z (:obj: ndarray(float, ndim=3)): meshgrid of Z values in meters.
+            pcharge_field (str, optional): Determines which field generated from the point
+                charges is calculated: 'Velocity', 'Acceleration', or 'Total'. Defaults to 'Total'.
+            plane(bool): True if meshgrid is 2 dimensional and returns 2D frames. Defaults to False.
+
+        Returns:
+            list of Ex, Ey, and Ez ndarrays with a leading time axis, followed by 2 grid
+            dimensions if plane is True, otherwise 3.
+        """
+        ts = np.asarray(ts, dtype=float)
+        shape = np.broadcast(X, Y, Z).shape
+        points = FRAME_POINTS
+        if self.max_memory is not None:
+            points = self.max_memory // (_BYTES_PER_POINT*len(self.charges))
+        step = max(points // int(np.prod(shape)), 1)
+        E = tuple(np.empty((len(ts),) + shape, self.dtype) for _ in range(3))
+        previous = {}
+        # index of the last frame, in front of the grid axes of 2D or 3D grids
+        last = (Ellipsis, slice(-1, None)) + (slice(None),)*len(shape)
+        for start in range(0, len(ts), step):
+            t = ts[start:start + step].reshape((-1,) + (1,)*len(shape))
+            grid = [np.broadcast_to(A, t.shape[:1] + shape) for A in (X, Y, Z)]
+            retarded = []
+            for source in self.sources:
+                for part in self._parts(source, grid[0].size):
+                    retarded.append(self._retarded_charge(part, t, *grid, cache=False,
+                                                          previous=previous.get(part)))
+                    # the last frame of a pass warm starts all frames of the next pass
+                    tr = retarded[-1]["tr"]
+                    previous[part] = (t[-1], tr[last])
+            for frames, field in zip(E, FieldSnapshot(self, t, *grid, retarded).E(pcharge_field)):
+                frames[start:start + step] = field
+        return _reduce_plane(E, shape) if plane else E
+
+    def calculate_Eabs_adaptive(self, t, x, y, z=0., levels=3, tol=0.05, grad_tol=0.5,
+                                output='grid'):
+        """Calculates the electric field amplitude |E| on the grid x, y in the plane z by
+        adaptive quadtree refinement.
+
+        Evaluation starts on every 2**levels-th grid line. Each cell is probed at its
+        center and split into four where log10|E| of the probe deviates from the bilinear
+        interpolation of the corners by more than tol, or where the corners differ by
+        more than grad_tol, down to cells of one grid step. Retarded times of new points
+        are warm started from a corner of their parent cell.
+
+        Args:
+            t (float): Time of simulation in seconds.
+            x (:obj: ndarray(float, ndim=1)): x values of the grid in meters.
+            y (:obj: ndarray(float, ndim=1)): y values of the grid in meters.
+            z (float, optional): z value of the plane in meters. Defaults to 0.
+            levels (int, optional): Number of refinement levels below the coarse grid.
+                Defaults to 3.
+            tol (float, optional): Tolerance of the interpolated log10|E|. Defaults to 0.05.
+            grad_tol (float, optional): Largest difference of log10|E| across a cell.
+                Defaults to 0.5.
+            output (str, optional): 'grid' or 'cells'. Defaults to 'grid'.
+
+        Returns:
+            For 'grid', |E| on the grid, shape (len(x), len(y)), with the points that are
+            not evaluated interpolated bilinearly in log10|E| within their cell, and a bool
+            array of the evaluated points. For 'cells', a dict of the leaf cells with their
+            grid index ranges 'i0', 'i1', 'j0', 'j1', bounds 'x0', 'x1', 'y0', 'y1' and
+            corner amplitudes 'Eabs' of shape (N_cells, 2, 2), and the number of evaluated
+            points 'evaluations'.
+        """
+        if output not in ('grid', 'cells'):
+            raise ValueError("output must be 'grid' or 'cells'.")
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        nx, ny = len(x), len(y)
+        log_E = np.full((nx, ny), np.nan)
+        evaluated = np.zeros((nx, ny), dtype=bool)
+        parts = [part for source in self.sources for part in self._parts(source, nx*ny)]
+        trs = [None]*len(parts)
+
+        def evaluate(i, j, gi, gj):
+            "Evaluates the new grid points (i, j), warm started from the points (gi, gj)."
+            new = np.flatnonzero(~evaluated[i, j])
+            new = new[np.unique(i[new]*ny + j[new], return_index=True)[1]]
+            if len(new) == 0:
+                return
+            i, j, gi, gj = i[new], j[new], gi[new], gj[new]
+            X, Y, Z = x[i], y[j], np.full(len(i), float(z))
+            retarded = [self._retarded_charge(part, t, X, Y, Z, cache=False,
+                                              previous=None if tr is None else (t, tr[..., gi, gj]))
+                        for part, tr in zip(parts, trs)]
+            E = FieldSnapshot(self, t, X, Y, Z, retarded).E('Total')
+            with np.errstate(divide='ignore'):
+                log_E[i, j] = 0.5*np.log10(sum(np.asarray(Ei, dtype=float)**2 for Ei in E))
+            evaluated[i, j] = True
+            for k, retarded_charge in enumerate(retarded):
+                tr = retarded_charge["tr"]
+                if trs[k] is None:
+                    trs[k] = np.full(tr.shape[:-1] + (nx, ny), np.nan)
+                trs[k][..., i, j] = tr
+
+        step = 2**levels
+        ci = np.unique(np.append(np.arange(0, nx, step), nx - 1))
+        cj = np.unique(np.append(np.arange(0, ny, step), ny - 1))
+        I, J = (A.ravel() for A in np.meshgrid(ci, cj, indexing='ij'))
+        evaluate(I, J, I, J)
+        I0, J0 = (A.ravel() for A in np.meshgrid(ci[:-1], cj[:-1], indexing='ij'))
+        I1, J1 = (A.ravel() for A in np.meshgrid(ci[1:], cj[1:], indexing='ij'))
+        cells = np.stack([I0, I1, J0, J1])
+        leaves = []
+        while cells.shape[1] > 0:
+            i0, i1, j0, j1 = cells
+            splittable = (i1 - i0 >= 2) | (j1 - j0 >= 2)
+            leaves.append(cells[:, ~splittable])
+            cells = cells[:, splittable]
+            i0, i1, j0, j1 = cells
+            im, jm = (i0 + i1)//2, (j0 + j1)//2
+            evaluate(im, jm, i0, j0)
+            corners = np.stack([log_E[i0, j0], log_E[i0, j1], log_E[i1, j0], log_E[i1, j1]])
+            fi = (im - i0)/(i1 - i0)
+            fj = (jm - j0)/(j1 - j0)
+            bilinear = ((1 - fi)*(1 - fj)*corners[0] + (1 - fi)*fj*corners[1]
+                        + fi*(1 - fj)*corners[2] + fi*fj*corners[3])
+            with np.errstate(invalid='ignore'):
+                refine = ~(np.abs(log_E[im, jm] - bilinear) <= tol)
+                refine |= ~(corners.max(axis=0) - corners.min(axis=0) <= grad_tol)
+            leaves.append(cells[:, ~refine])
+            cells = cells[:, refine]
+            i0, i1, j0, j1 = cells
+            im, jm = (i0 + i1)//2, (j0 + j1)//2
+            children = np.concatenate([np.stack([a0, a1, b0, b1, i0, j0])
+                                       for a0, a1 in ((i0, im), (im, i1))
+                                       for b0, b1 in ((j0, jm), (jm, j1))], axis=1)
+            # cells of one grid step along an axis are only split along the other
+            children = children[:, (children[1] > children[0]) & (children[3] > children[2])]
+            for corner_i, corner_j in ((0, 2), (0, 3), (1, 2), (1, 3)):
+                evaluate(children[corner_i], children[corner_j], children[4], children[5])
+            cells = children[:4]
+        leaves = np.concatenate(leaves, axis=1)
+        i0, i1, j0, j1 = leaves
+
+        if output == 'cells':
+            return {"i0": i0, "i1": i1, "j0": j0, "j1": j1,
+                    "x0": x[i0], "x1": x[i1], "y0": y[j0], "y1": y[j1],
+                    "Eabs": 10**np.stack([np.stack([log_E[i0, j0], log_E[i0, j1]], axis=-1),
+                                          np.stack([log_E[i1, j0], log_E[i1, j1]], axis=-1)], axis=1),
+                    "evaluations": int(np.count_nonzero(evaluated))}
+        # bilinear interpolation of log10|E| within the leaf cells, grouped by cell size
+        interpolated = log_E.copy()
+        widths = np.stack([i1 - i0, j1 - j0])
+        for wi, wj in np.unique(widths, axis=1).T:
+            group = (widths[0] == wi) & (widths[1] == wj)
+            a = np.arange(wi + 1)
+            b = np.arange(wj + 1)
+            I = i0[group, None, None] + a[None, :, None]
+            J = j0[group, None, None] + b[None, None, :]
+            fi = (a/wi)[None, :, None]
+            fj = (b/wj)[None, None, :]
+            g0, g1, h0, h1 = (index[group, None, None] for index in (i0, i1, j0, j1))
+            values = ((1 - fi)*(1 - fj)*log_E[g0, h0] + (1 - fi)*fj*log_E[g0, h1]
+                      + fi*(1 - fj)*log_E[g1, h0] + fi*fj*log_E[g1, h1])
+            I, J = np.broadcast_arrays(I, J)
+            missing = ~evaluated[I, J]
+            interpolated[I[missing], J[missing]] = values[missing]
+        return 10**interpolated, evaluated
+
+    def calculate_E_progressive(self, t, x, y, z=0., levels=3, pcharge_field='Total'):
+        """Calculates the electric field E on the grid x, y in the plane z from coarse to fine.
+
+        Level k evaluates every 2**(levels - k)-th grid line (and the last one), so that
+        the last level is the full grid. The retarded times of a level, upsampled
+        bilinearly, are the starting guess of the next one.
+
+        Args:
+            t (float): Time of simulation in seconds.
+            x (:obj: ndarray(float, ndim=1)): x values of the grid in meters.
+            y (:obj: ndarray(float, ndim=1)): y values of the grid in meters.
+            z (float, optional): z value of the plane in meters. Defaults to 0.
+            levels (int, optional): Number of levels above the full grid. Defaults to 3.
+            pcharge_field (str, optional): Determines which field generated from the point
+                charges is calculated: 'Velocity', 'Acceleration', or 'Total'. Defaults to 'Total'.
+
+        Yields:
+            For each level, the indices i, j of its grid lines into x and y and the list
+            of Ex, Ey, and Ez ndarrays of shape (len(i), len(j)).
+        """
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        parts = [part for source in self.sources for part in self._parts(source, x.size*y.size)]
+        trs = [None]*len(parts)
+        previous = None
+        for level in range(levels, -1, -1):
+            i = np.unique(np.append(np.arange(0, len(x), 2**level), len(x) - 1))
+            j = np.unique(np.append(np.arange(0, len(y), 2**level), len(y) - 1))
+            if previous is not None and len(i) == len(previous[0]) and len(j) == len(previous[1]):
+                continue
+            X, Y = np.meshgrid(x[i], y[j], indexing='ij')
+            Z = np.full(X.shape, float(z))
+            retarded = []
+            for k, part in enumerate(parts):
+                guess = None if previous is None else (t, _upsample(trs[k], *previous, i, j))
+                retarded.append(self._retarded_charge(part, t, X, Y, Z, previous=guess, cache=False))
+                trs[k] = retarded[-1]["tr"]
+            previous = (i, j)
+            yield i, j, FieldSnapshot(self, t, X, Y, Z, retarded).E(pcharge_field)
 
     def calculate_B(self, t, X, Y, Z, pcharge_field='Total', plane=False):
         """Calculates the magnetic field B generated from the point charge(s).
@@ -88,74 +417,170 @@ class MovingChargesField():
         Returns:
             list of Ex, Ey, and Ez ndarrays which are 2 dimensional if plane is True, otherwise 3.
         """
-        t_array = np.ones((X.shape))
-        t_array[:, :, :] = t
-        Bx = np.zeros((X.shape))
-        By = np.zeros((X.shape))
-        Bz = np.zeros((X.shape))
-        for charge in self.charges:
-            # Determine retarded time of charge to calculate B
-            tr = optimize.newton(func=charge.retarded_time, x0=t_array,
-                                 args=(t_array, X, Y, Z), tol=self.h)
-            Ex, Ey, Ez = self._calculate_individual_E(
-                charge, tr, X, Y, Z, pcharge_field)
-            rx = X - charge.xpos(tr)
-            ry = Y - charge.ypos(tr)
-            rz = Z - charge.zpos(tr)
-            r_mag = (rx**2 + ry**2 + rz**2)**0.5
-            # Griffiths Eq. 10.73
-            Bx += 1/(c*r_mag)*(ry*Ez-rz*Ey)
-            By += 1/(c*r_mag)*(rz*Ex-rx*Ez)
-            Bz += 1/(c*r_mag)*(rx*Ey-ry*Ex)
-        if plane:
-            if X.shape[0] == 1:
-                return(Bx[0, :, :], By[0, :, :], Bz[0, :, :])
-            elif X.shape[1] == 1:
-                return(Bx[:, 0, :], By[:, 0, :], Bz[:, 0, :])
-            elif X.shape[2] == 1:
-                return(Bx[:, :, 0], By[:, :, 0], Bz[:, :, 0])
-        return (Bx, By, Bz)
-
-    def _calculate_individual_E(self, charge, tr, X, Y, Z, pcharge_field):
-        "Calculates the electric field generated from an individual point charge."
-        # retarded position to field point - Griffiths Eq. 10.54
-        rx = X - charge.xpos(tr)
-        ry = Y - charge.ypos(tr)
-        rz = Z - charge.zpos(tr)
+        B = self.snapshot(t, X, Y, Z).B(pcharge_field)
+        return _reduce_plane(B, X.shape) if plane else B
+
+    def _parts(self, source, grid_size):
+        """Splits a ChargeEnsemble into chunks of at most ensemble_points (charge, point)
+        pairs, or fewer if max_memory is set."""
+        if isinstance(source, ChargeEnsemble):
+            pairs = self.ensemble_points
+            if self.max_memory is not None:
+                pairs = min(pairs, self.max_memory // (self.workers*_BYTES_PER_POINT))
+            # an empty grid (e.g. no field line seeds) needs no chunking
+            return source.chunks(pairs // max(grid_size, 1))
+        return [source]
+
+    def _retarded_charge(self, source, t, X, Y, Z, tr=None, previous=None, cache=True):
+        """Solves the retarded time of a point charge or ChargeEnsemble and returns its
+        retarded kinematics in dimensionless form and in the field dtype: the vector r
+        from the retarded position to the field points in units of 'scale' (about the
+        largest distance), the velocity 'beta' in units of c and the acceleration 'a' in units
+        of c**2/scale. Arrays of an ensemble have a leading charge axis. A known
+        retarded time tr skips the solve."""
+        if tr is None:
+            tr = self._solve_retarded_time(source, t, X, Y, Z, previous, cache)
+        # retarded position, velocity and acceleration - Griffiths Eq. 10.54
+        (x, y, z), v, a = source.kinematics(tr)
+        # retarded position to field point
+        rx = X - x
+        ry = Y - y
+        rz = Z - z
         r_mag = (rx**2 + ry**2 + rz**2)**0.5
-        vx = charge.xvel(tr)  # retarded velocity - Griffiths Eq. 10.54
-        vy = charge.yvel(tr)
-        vz = charge.zvel(tr)
-        ax = charge.xacc(tr)  # retarded acceleration
-        ay = charge.yacc(tr)
-        az = charge.zacc(tr)
-        ux = c*rx/r_mag - vx  # Griffiths Eq. 10.71
-        uy = c*ry/r_mag - vy
-        uz = c*rz/r_mag - vz
-        r_dot_u = rx*ux + ry*uy + rz*uz
-        r_dot_a = rx*ax + ry*ay + rz*az
-        vel_mag = (vx**2 + vy**2 + vz**2)**0.5
+        # a power of two scale is exact, so results do not depend on the grid extent or tiling
+        scale = np.ldexp(1., np.frexp(np.max(r_mag, initial=0, where=np.isfinite(r_mag)))[1])
+        if isinstance(source, ChargeEnsemble):
+            sign = source.sign(X.ndim)
+        else:
+            sign = 1 if source.pos_charge else -1
+        dtype = self.dtype
+        return {"source": source, "ensemble": isinstance(source, ChargeEnsemble), "tr": tr,
+                "scale": scale, "r": tuple(np.asarray(ri/scale, dtype) for ri in (rx, ry, rz)),
+                "r_mag": np.asarray(r_mag/scale, dtype),
+                "beta": tuple(np.asarray(vi/c, dtype) for vi in v),
+                "a": tuple(np.asarray(ai*(scale/c**2), dtype) for ai in a), "sign": sign}
+
+    def _solve_retarded_time(self, source, t, X, Y, Z, previous=None, cache=True):
+        """Solves the retarded time of a point charge or ChargeEnsemble.
+
+        Sources with a closed-form solve_retarded_time are solved directly; points it
+        leaves unresolved (NaN) and all other sources go to the RetardedTimeSolver.
+        With warm_start, the previous numeric solution tr_prev at t_prev on the same
+        grid is advanced to tr_prev + (t - t_prev) and used as starting guess. With
+        cache=False the warm start cache is bypassed and previous, a (t_prev, tr_prev)
+        tuple or None, is used instead.
+        """
+        restrict = None
+        if isinstance(source, ChargeEnsemble):
+            grid_size = np.broadcast(X, Y, Z).size
+            X, Y, Z = source.broadcast_grid(X, Y, Z)
+            restrict = _ensemble_restrict(source, np.arange(X.size)//grid_size)
+        closed_form = getattr(source, "solve_retarded_time", None)
+        tr = closed_form(t, X, Y, Z) if closed_form is not None else None
+        if tr is not None:
+            tr = np.broadcast_to(tr, X.shape).copy()
+            unresolved = ~np.isfinite(tr)
+            info = {"converged": np.ones(X.shape, dtype=bool),
+                    "iterations": np.zeros(X.shape, dtype=int),
+                    "residual": np.zeros(X.shape), "sweeps": 0, "evaluations": 0}
+            if unresolved.any():
+                if restrict is not None:
+                    restrict = _ensemble_restrict(
+                        source, np.flatnonzero(unresolved)//(X.size//len(source)))
+                t_unresolved = np.broadcast_to(t, X.shape)[unresolved]
+                tr[unresolved], numeric_info = self.solver.solve(
+                    source, t_unresolved, X[unresolved], Y[unresolved], Z[unresolved],
+                    restrict=restrict)
+                for name in ("converged", "iterations", "residual"):
+                    info[name][unresolved] = numeric_info[name]
+                info["sweeps"] = numeric_info["sweeps"]
+                info["evaluations"] = numeric_info["evaluations"]
+            self._record_solve(source, info, warm=False, closed_form=True)
+            return tr
+
+        if cache:
+            key = (id(source), _grid_key(X, Y, Z))
+            previous = self._tr_cache.get(key) if self.warm_start else None
+        tr0 = None
+        if previous is not None:
+            t_prev, tr_prev = previous
+            tr0 = tr_prev + (t - t_prev)
+        tr, info = self.solver.solve(source, t, X, Y, Z, tr0=tr0, restrict=restrict)
+        self._record_solve(source, info, warm=previous is not None)
+        if cache:
+            self._store_warm_start(key, t, tr)
+        return tr
+
+    def _store_warm_start(self, key, t, tr):
+        "Keeps a retarded time solution for warm starts, evicting the least recently used."
+        if self.warm_start:
+            self._tr_cache[key] = (t, tr)
+            self._tr_cache.move_to_end(key)
+            while len(self._tr_cache) > self.warm_start_size:
+                self._tr_cache.popitem(last=False)
+
+    def _record_solve(self, source, info, warm, closed_form=False):
+        "Keeps the diagnostics of a retarded time solve."
+        with self._lock:
+            self.last_info[source] = info
+            self._add_stats({"solves": 1, "warm_solves": warm, "closed_form_solves": closed_form,
+                             "iterations": info["sweeps"], "evaluations": info["evaluations"],
+                             "unconverged": int(np.count_nonzero(~info["converged"]))})
+
+    def _add_stats(self, stats):
+        for name, value in stats.items():
+            self.stats[name] += value
+
+    def _calculate_individual_E(self, retarded, pcharge_field, out):
+        """Calculates the electric field generated from an individual point charge into
+        the arrays out (Ex, Ey, Ez).
+
+        Griffiths Eq. 10.72 is evaluated with the dimensionless kinematics of
+        _retarded_charge, which keeps all intermediates within float32 range, and
+        with scratch arrays of the field workspace.
+        """
+        velocity = pcharge_field in ('Velocity', 'Total')
+        acceleration = pcharge_field in ('Acceleration', 'Total')
+        if not (velocity or acceleration):
+            raise ValueError("pcharge_field must be 'Velocity', 'Acceleration', or 'Total'.")
+        r = retarded["r"]
+        r_mag = retarded["r_mag"]
+        beta = retarded["beta"]
+        a = retarded["a"]
+        workspace = self._workspace(r_mag.shape)
+        tmp = workspace("tmp")
+        u = (workspace("ux"), workspace("uy"), workspace("uz"))
+        for ui, ri, beta_i in zip(u, r, beta):
+            np.divide(ri, r_mag, out=ui)
+            np.subtract(ui, beta_i, out=ui)  # Griffiths Eq. 10.71 in units of c
+        r_dot_u = _dot(r, u, workspace("r_dot_u"), tmp)
         # Griffiths Eq. 10.72
-        const = e/(4*pi*eps) * r_mag/(r_dot_u)**3
-        if not charge.pos_charge:  # negative charge
-            const *= -1
-        xvel_field = const*(c**2-vel_mag**2)*ux
-        yvel_field = const*(c**2-vel_mag**2)*uy
-        zvel_field = const*(c**2-vel_mag**2)*uz
-        # Using triple product rule to simplify Eq. 10.72
-        xacc_field = const*(r_dot_a*ux - r_dot_u*ax)
-        yacc_field = const*(r_dot_a*uy - r_dot_u*ay)
-        zacc_field = const*(r_dot_a*uz - r_dot_u*az)
-        if pcharge_field == 'Velocity':
-            return (xvel_field, yvel_field, zvel_field)
-        if pcharge_field == 'Acceleration':
-            return (xacc_field, yacc_field, zacc_field)
-        if pcharge_field == 'Total':
-            return (xvel_field+xacc_field, yvel_field+yacc_field,
-                    zvel_field+zacc_field)
+        const = np.power(r_dot_u, 3, out=workspace("const"))
+        np.divide(r_mag, const, out=const)
+        np.multiply(const, retarded["sign"]*e/(4*pi*eps)/retarded["scale"]**2, out=const)
+        # E = coef_u*u - coef_a*a, using triple product rule to simplify Eq. 10.72
+        coef_u = workspace("coef_u")
+        if velocity:
+            _dot(beta, beta, coef_u, tmp)
+            np.subtract(1, coef_u, out=coef_u)
+            coef_u *= const
+        if acceleration:
+            r_dot_a = _dot(r, a, workspace("r_dot_a"), tmp)
+            r_dot_a *= const
+            if velocity:
+                coef_u += r_dot_a
+            else:
+                coef_u[...] = r_dot_a
+            coef_a = np.multiply(const, r_dot_u, out=workspace("coef_a"))
+        for out_i, u_i, a_i in zip(out, u, a):
+            np.multiply(coef_u, u_i, out=out_i)
+            if acceleration:
+                np.multiply(coef_a, a_i, out=tmp)
+                out_i -= tmp
+        return out
 
     def calculate_potentials(self, t, X, Y, Z, plane=False):
-        """Calculates the magnetic field B generated from the point charge(s).
+        """Calculates the scalar and vector potentials generated from the point charge(s).
 
         Args:
             t (float): Time of simulation in seconds.
@@ -167,43 +592,8 @@ class MovingChargesField():
         Returns:
             list of V, Ax, Ay, and Az ndarrays which are 2 dimensional if plane is True, otherwise 3.
         """
-        t_array = np.ones((X.shape))
-        t_array[:, :, :] = t
-        V = np.zeros((X.shape))
-        Ax = np.zeros((X.shape))
-        Ay = np.zeros((X.shape))
-        Az = np.zeros((X.shape))
-        for charge in self.charges:
-            # Determine retarded time of charge to calculate potentials
-            tr = optimize.newton(func=charge.retarded_time, x0=t_array,
-                                 args=(t_array, X, Y, Z), tol=self.h)
-            # retarded position to field point - Griffiths Eq. 10.54
-            rx = X - charge.xpos(tr)
-            ry = Y - charge.ypos(tr)
-            rz = Z - charge.zpos(tr)
-            r_mag = (rx**2 + ry**2 + rz**2)**0.5
-            vx = charge.xvel(tr)  # retarded velocity - Griffiths Eq. 10.54
-            vy = charge.yvel(tr)
-            vz = charge.zvel(tr)
-            r_dot_v = rx*vx + ry*vy + rz*vz
-            # Griffiths Eq. 10.53
-            if charge.pos_charge:
-                individual_V = e*c/(4*pi*eps*(r_mag*c-r_dot_v))
-            else:
-                individual_V = -e*c/(4*pi*eps*(r_mag*c-r_dot_v))
-            V += individual_V
-            # Griffiths Eq. 10.53
-            Ax += vx/c**2*individual_V
-            Ay += vy/c**2*individual_V
-            Az += vz/c**2*individual_V
-        if plane:
-            if X.shape[0] == 1:
-                return(V[0, :, :], Ax[0, :, :], Ay[0, :, :], Az[0, :, :])
-            elif X.shape[1] == 1:
-                return(V[:, 0, :], Ax[:, 0, :], Ay[:, 0, :], Az[:, 0, :])
-            elif X.shape[2] == 1:
-                return(V[:, :, 0], Ax[:, :, 0], Ay[:, :, 0], Az[:, :, 0])
-        return (V, Ax, Ay, Az)
+        potentials = self.snapshot(t, X, Y, Z).potentials()
+        return _reduce_plane(potentials, X.shape) if plane else potentials
 
     def calculate_Poynting(self, t, X, Y, Z, plane=False):
         """Calculates the Poynting vector S generated from the point charge(s).
@@ -218,69 +608,620 @@ class MovingChargesField():
         Returns:
             S ndarray which are 2 dimensional if plane is True, otherwise 3.
         """
-        t_array = np.ones((X.shape))
-        t_array[:, :, :] = t
-        Ex = np.zeros((X.shape))
-        Ey = np.zeros((X.shape))
-        Ez = np.zeros((X.shape))
-        for charge in self.charges:
-            # Determine retarded time of charge to calculate E
-            tr = optimize.newton(func=charge.retarded_time, x0=t_array,
-                                 args=(t_array, X, Y, Z), tol=self.h)
-            E_field = self._calculate_individual_E(
-                charge, tr, X, Y, Z, 'Acceleration')
-            Ex += E_field[0]
-            Ey += E_field[1]
-            Ez += E_field[2]
-        S = 1/(mu*c)*(Ex**2+Ey**2+Ez**2)  # Griffiths 11.67
-
-        if plane:
-            if X.shape[0] == 1:
-                return S[0, :, :]
-            elif X.shape[1] == 1:
-                return S[:, 0, :]
-            elif X.shape[2] == 1:
-                return S[:, :, 0]
-        return S
-
-
-    def calculate_FieldLines_Tsien(self, t, lim, Nlines, Nintsteps=1000):
+        S = self.snapshot(t, X, Y, Z).Poynting()
+        return _reduce_plane((S,), X.shape)[0] if plane else S
+
+    def calculate_FieldLines_Tsien(self, t, lim, Nlines, Nintsteps=200, rtol=1e-8, max_turn=0.1,
+                                   max_nodes=4096):
+        """Calculates electric field lines of the first point charge in its plane of motion
+        with Tsien's method.
+
+        The angle alpha between a field line and the retarded velocity obeys
+        dalpha/dR = A(R) + B(R) sin(alpha) + C(R) cos(alpha) along the distance R from the
+        retarded position, with coefficients given by the kinematics at t - R/c. With
+        tan(alpha/2) = P/Q this is the linear system d(P, Q)/dR = M(R) (P, Q), so a single
+        2x2 propagator, integrated with the 4th order Magnus method, advances all lines
+        at once. Steps of the initial Nintsteps are bisected until the Magnus error is
+        below rtol. Output points are then inserted where a field line turns by more
+        than max_turn, which gives adaptive arclength spacing.
+
+        Args:
+            t (float): Time of simulation in seconds.
+            lim (float): Largest distance R from the retarded position in meters.
+            Nlines (int): Number of field lines.
+            Nintsteps (int, optional): Initial number of steps. Defaults to 200.
+            rtol (float, optional): Tolerance of a propagator step. Defaults to 1e-8.
+            max_turn (float, optional): Largest turn of a field line between two output
+                points in radians. Defaults to 0.1.
+            max_nodes (int, optional): Largest number of output points. Defaults to 4096.
+
+        Returns:
+            us, vs (x and y of the field lines in meters) and alphas, each of shape
+            (Nlines, N_R), and the distances Rs of shape (N_R,).
+        """
         charge = self.charges[0]
         # initial angles boosted to lab frame
-        beta = np.sqrt(charge.xvel(t)**2 + charge.yvel(t)**2) / c
-        theta0 = np.arctan2(charge.yvel(t), charge.xvel(t))
+        _, (vx, vy, _), _ = charge.kinematics(t)
+        beta = np.sqrt(vx**2 + vy**2) / c
         alpha0s = 2* np.arctan((1-beta)**0.5/(1+beta)**0.5 * np.tan(np.pi*np.arange(Nlines)/Nlines))
+        PQ0 = np.array([np.sin(alpha0s/2), np.cos(alpha0s/2)])
+
+        def generator(R):
+            return _tsien_generator(charge, t, R)
+
+        def field_lines(Rs, Phi):
+            (x, y, _), (vx, vy, _), _ = charge.kinematics(t - Rs/c)
+            alphas = 2*np.arctan2(*np.matmul(Phi, PQ0).transpose(1, 0, 2)).T
+            phis = np.arctan2(vy, vx) + alphas
+            return x + Rs*np.cos(phis), y + Rs*np.sin(phis), alphas
+
+        Rs = np.linspace(1e-3*lim, lim, Nintsteps + 1)
+        while True:
+            U, error = _magnus_steps(generator, Rs[:-1], Rs[1:])
+            refine = error > rtol
+            if not refine.any() or len(Rs) + np.count_nonzero(refine) > max_nodes:
+                break
+            Rs = np.sort(np.concatenate([Rs, 0.5*(Rs[:-1] + Rs[1:])[refine]]))
+        Phi = _cumulative_product(U)
+        us, vs, alphas = field_lines(Rs, Phi)
+
+        while len(Rs) < max_nodes:
+            du = np.diff(us, axis=1)
+            dv = np.diff(vs, axis=1)
+            turn = np.abs(np.arctan2(du[:, 1:]*dv[:, :-1] - dv[:, 1:]*du[:, :-1],
+                                     du[:, 1:]*du[:, :-1] + dv[:, 1:]*dv[:, :-1])).max(axis=0)
+            refine = np.zeros(len(Rs) - 1, dtype=bool)
+            refine[1:] |= turn > max_turn
+            refine[:-1] |= turn > max_turn
+            left = np.flatnonzero(refine)[:max_nodes - len(Rs)]
+            if len(left) == 0:
+                break
+            # new points are propagated from their left neighbour
+            R_new = 0.5*(Rs[left] + Rs[left + 1])
+            Phi_new = np.matmul(_magnus_steps(generator, Rs[left], R_new)[0], Phi[left])
+            Phi_new /= np.abs(Phi_new).max(axis=(1, 2), keepdims=True)
+            order = np.argsort(np.concatenate([Rs, R_new]), kind='stable')
+            Rs = np.concatenate([Rs, R_new])[order]
+            Phi = np.concatenate([Phi, Phi_new])[order]
+            us, vs, alphas = (np.concatenate([old, new], axis=1)[:, order]
+                              for old, new in zip((us, vs, alphas), field_lines(R_new, Phi_new)))
+        return us, vs, np.unwrap(alphas, axis=1, period=4*np.pi), Rs
+
+    def calculate_FieldLines(self, t, bounds, Nlines, plane=True, sources='all', r0=None,
+                             rtol=1e-4, max_steps=2000):
+        """Traces electric field lines of all point charges, in a plane or in 3D.
+
+        Lines start on small circles (plane) or spheres around the present positions of the
+        charges, with a share of Nlines proportional to the charge and directions that are
+        uniform in the rest frame of the charge, so that each line carries the same flux.
+        Lines of positive charges follow E and lines of negative charges -E. All lines are
+        advanced together by adaptive Bogacki-Shampine (RK23) steps in arclength, each with
+        its own step size, and E is evaluated by the retarded time machinery of the field,
+        warm started from the previous point of each line. A line ends when it leaves the
+        bounds, reaches a charge or a null of the field, after 10 times the size of the
+        bounds, or after max_steps steps.
+
+        Args:
+            t (float): Time of simulation in seconds.
+            bounds (tuple): ((xmin, xmax), (ymin, ymax), (zmin, zmax)) of the traced region
+                in meters. For plane=True the lines stay in the plane of the charges.
+            Nlines (int): Total number of field lines.
+            plane (bool, optional): Seed the lines in the x-y plane of each charge instead of
+                on spheres. Defaults to True.
+            sources (str, optional): Seed lines on 'all', 'positive' or 'negative' charges.
+                Defaults to 'all'.
+            r0 (float, optional): Radius of the seeds around the charges in meters. Defaults to
+                1e-3 of the size of the bounds, or less for close charges.
+            rtol (float, optional): Position tolerance of a step relative to the size of the
+                bounds. Defaults to 1e-4.
+            max_steps (int, optional): Maximum number of steps of a line. Defaults to 2000.
+
+        Returns:
+            list of field lines, each an ndarray(float) of shape (N_points, 3) in meters.
+        """
+        bounds = np.array(bounds, dtype=float)
+        size = np.max(bounds[:, 1] - bounds[:, 0])
+        charges = [charge for charge in self.charges
+                   if sources == 'all' or charge.pos_charge == (sources == 'positive')]
+        positions = np.array([[float(x) for x in charge.kinematics(t)[0]]
+                              for charge in self.charges])
+        if r0 is None:
+            r0 = 1e-3*size
+            if len(positions) > 1:
+                distances = np.linalg.norm(positions[:, None] - positions[None], axis=-1)
+                r0 = min(r0, 0.1*np.min(distances[np.triu_indices(len(positions), 1)]))
+
+        # seeds, with equal charges every charge gets an equal share of the lines
+        counts = np.full(len(charges), Nlines // max(len(charges), 1))
+        counts[:Nlines - counts.sum()] += 1
+        points = []
+        directions = []
+        for charge, count in zip(charges, counts):
+            (x, y, z), v, _ = charge.kinematics(t)
+            unit = _field_line_seeds(count, plane, np.array(v, dtype=float)/c)
+            points.append(np.array([x, y, z], dtype=float) + r0*unit)
+            directions.append(np.full(count, 1. if charge.pos_charge else -1.))
+        points = np.concatenate(points) if points else np.empty((0, 3))
+        directions = np.concatenate(directions) if directions else np.empty(0)
+
+        # retarded times are warm started from the previous point of each line
+        parts = [part for source in self.sources for part in self._parts(source, len(points))]
+        trs = [None]*len(parts)
+
+        def direction(points, active):
+            X, Y, Z = points.T
+            previous = [None if tr is None else (t, tr[..., active]) for tr in trs]
+            retarded = [self._retarded_charge(part, t, X, Y, Z, previous=prev, cache=False)
+                        for part, prev in zip(parts, previous)]
+            E = np.array(FieldSnapshot(self, t, X, Y, Z, retarded).E('Total'), dtype=float).T
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return (directions[active, None]*E/np.linalg.norm(E, axis=1, keepdims=True),
+                        [retarded_charge["tr"] for retarded_charge in retarded])
+
+        n = len(points)
+        lines = [[point.copy()] for point in points]
+        active = np.arange(n)
+        h = np.full(n, 1e-2*size)
+        length = np.zeros(n)
+        steps = np.zeros(n, dtype=int)
+        k1, trs_active = direction(points, active)
+        trs = [np.full(tr.shape[:-1] + (n,), np.nan) for tr in trs_active]
+        for tr, tr_active in zip(trs, trs_active):
+            tr[..., active] = tr_active
+        atol = rtol*size
+        while len(active) > 0:
+            y = points[active]
+            hs = h[active, None]
+            k2, _ = direction(y + hs/2*k1, active)
+            k3, _ = direction(y + 3*hs/4*k2, active)
+            y_new = y + hs*(2/9*k1 + 1/3*k2 + 4/9*k3)
+            k4, trs_new = direction(y_new, active)
+            error = np.linalg.norm(hs*(-5/72*k1 + 1/12*k2 + 1/9*k3 - 1/8*k4), axis=1)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                factor = np.clip(0.9*(atol/error)**(1/3), 0.2, 5)
+            factor[~np.isfinite(factor)] = 5
+            finite = np.isfinite(y_new).all(axis=1)
+            stalled = h[active] <= 1e-3*atol
+            accept = (error <= atol) | stalled
+            # a line reverses its direction where it crosses a null of the field
+            stalled |= accept & (np.sum(k1*k4, axis=1) < 0)
+            h[active] = np.minimum(h[active]*factor, 0.05*size)
+
+            idx = active[accept & finite]
+            points[idx] = y_new[accept & finite]
+            length[idx] += np.linalg.norm(y_new - y, axis=1)[accept & finite]
+            steps[active[accept]] += 1
+            for tr, tr_new in zip(trs, trs_new):
+                tr[..., idx] = tr_new[..., accept & finite]
+            for i, point in zip(idx, points[idx]):
+                lines[i].append(point.copy())
+            k1[accept] = k4[accept]
+
+            inside = np.all((points[active] >= bounds[:, 0]) & (points[active] <= bounds[:, 1]),
+                            axis=1)
+            distance = np.linalg.norm(points[active, None] - positions[None], axis=-1).min(axis=1)
+            reached = (distance < r0) & (length[active] > 2*r0)
+            done = (~finite | ~inside | reached | stalled | (steps[active] >= max_steps)
+                    | (length[active] > 10*size) | ~np.isfinite(k1).all(axis=1))
+            active = active[~done]
+            k1 = k1[~done]
+        return [np.array(line) for line in lines]
+
+
+def _tsien_generator(charge, t, R):
+    """Generator M(R) of the linear system d(P, Q)/dR = M (P, Q), tan(alpha/2) = P/Q, of
+    Tsien's field line equation, shape R.shape + (2, 2)."""
+    _, (vx, vy, _), (ax, ay, _) = charge.kinematics(t - R/c)
+    gamma = (1 - (vx**2 + vy**2) / c**2)**(-0.5)
+    theta = np.arctan2(vy, vx)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        theta_dot = np.nan_to_num((vx*ay - vy*ax) / (vx**2 + vy**2))
+    # dalpha/dR = A + B sin(alpha) + C cos(alpha)
+    A = gamma*theta_dot/c
+    B = gamma*(ax*np.cos(theta) + ay*np.sin(theta))/c**2
+    C = gamma*(ax*np.sin(theta) - ay*np.cos(theta))/c**2
+    M = np.empty(np.shape(R) + (2, 2))
+    M[..., 0, 0] = B/2
+    M[..., 0, 1] = (A + C)/2
+    M[..., 1, 0] = (C - A)/2
+    M[..., 1, 1] = -B/2
+    return M
+
+
+def _field_line_seeds(count, plane, beta):
+    """Unit vectors from a charge moving at velocity beta (in units of c) to the seeds of its
+    field lines, uniform in the rest frame of the charge and Lorentz contracted along the
+    velocity, so that all lines carry the same flux."""
+    i = np.arange(count) + 0.5
+    if plane:
+        angle = 2*np.pi*i/count
+        unit = np.stack([np.cos(angle), np.sin(angle), np.zeros(count)], axis=1)
+    else:
+        # Fibonacci sphere
+        cos_polar = 1 - 2*i/count
+        azimuth = np.pi*(1 + 5**0.5)*i
+        sin_polar = (1 - cos_polar**2)**0.5
+        unit = np.stack([sin_polar*np.cos(azimuth), sin_polar*np.sin(azimuth), cos_polar], axis=1)
+    speed = np.linalg.norm(beta)
+    if speed > 0:
+        along = beta/speed
+        parallel = unit @ along
+        unit = unit + ((1 - speed**2)**0.5 - 1)*parallel[:, None]*along
+        unit /= np.linalg.norm(unit, axis=1, keepdims=True)
+    return unit
+
+
+def _magnus_steps(generator, R_start, R_end):
+    """Propagators of d(P, Q)/dR = M(R) (P, Q) over the steps from R_start to R_end with the
+    4th order Magnus method, and an error estimate of each step from two half steps."""
+    h = R_end - R_start
+    # Gauss-Legendre points of the steps and of both half steps
+    nodes = np.array([0.5 - 3**0.5/6, 0.5 + 3**0.5/6])
+    fractions = np.concatenate([nodes, 0.5*nodes, 0.5 + 0.5*nodes])
+    M = generator(R_start[:, None] + h[:, None]*fractions)
+    U = _magnus_propagator(M[:, 0], M[:, 1], h)
+    U_half = np.matmul(_magnus_propagator(M[:, 4], M[:, 5], h/2),
+                       _magnus_propagator(M[:, 2], M[:, 3], h/2))
+    error = np.abs(U - U_half).max(axis=(1, 2)) / np.abs(U_half).max(axis=(1, 2))
+    return U_half, error
+
+
+def _magnus_propagator(M1, M2, h):
+    "exp of the 4th order Magnus expansion for traceless 2x2 generators at the Gauss points."
+    h = h[:, None, None]
+    commutator = np.matmul(M2, M1) - np.matmul(M1, M2)
+    Omega = h/2*(M1 + M2) + 3**0.5/12*h**2*commutator
+    # Omega is traceless, so Omega**2 = s*I and exp(Omega) = cosh(q) I + sinh(q)/q Omega
+    s = Omega[:, 0, 0]**2 + Omega[:, 0, 1]*Omega[:, 1, 0]
+    q = np.abs(s)**0.5
+    with np.errstate(over='ignore', invalid='ignore'):
+        cosh_q = np.where(s >= 0, np.cosh(q), np.cos(q))
+        sinhc_q = np.where(s >= 0, np.where(q > 1e-8, np.sinh(q)/q, 1.), np.sinc(q/np.pi))
+    return cosh_q[:, None, None]*np.eye(2) + sinhc_q[:, None, None]*Omega
+
+
+def _cumulative_product(U):
+    """Cumulative matrix products I, U[0], U[1] U[0], ... by a parallel prefix scan. Products
+    are normalized, since only the direction of (P, Q) matters."""
+    P = U.copy()
+    shift = 1
+    while shift < len(P):
+        P[shift:] = np.matmul(P[shift:], P[:-shift])
+        P /= np.abs(P).max(axis=(1, 2), keepdims=True)
+        shift *= 2
+    return np.concatenate([np.eye(2)[None], P])
+
+
+class FieldSnapshot():
+
+    def __init__(self, field, t, X, Y, Z, retarded=None):
+        """Fields of the point charge(s) of a MovingChargesField at one time and grid.
+
+        The retarded time and the retarded kinematics of each charge are solved once
+        on construction. E, B, the potentials and the Poynting vector are derived from
+        them lazily and memoized, so evaluating several quantities costs one retarded
+        time solve per charge.
+
+        Args:
+            field (:obj: MovingChargesField): Field of the point charge(s).
+            t (float): Time of simulation in seconds.
+            X (:obj: ndarray(float, ndim=3)): meshgrid of X values in meters.
+            Y (:obj: ndarray(float, ndim=3)): meshgrid of Y values in meters.
+            Z (:obj: ndarray(float, ndim=3)): meshgrid of Z values in meters.
+            retarded (list of dict, optional): Retarded charges from
+                MovingChargesField._retarded_charge. Defaults to solving all sources.
+        """
+        self.field = field
+        self.t = t
+        self.X = X
+        self.Y = Y
+        self.Z = Z
+        if retarded is None:
+            retarded = [field._retarded_charge(part, t, X, Y, Z)
+                        for source in field.sources
+                        for part in field._parts(source, np.broadcast(X, Y, Z).size)]
+        self.retarded = retarded
+        self._cache = {}
+
+    def matches(self, t, X, Y, Z):
+        "True if the snapshot was taken at time t on the same meshgrid arrays."
+        return t == self.t and X is self.X and Y is self.Y and Z is self.Z
+
+    def _individual_E(self, pcharge_field):
+        "Electric field of each source, with a leading charge axis for ChargeEnsembles."
+        key = ('E_individual', pcharge_field)
+        if key not in self._cache:
+            dtype = self.field.dtype
+            self._cache[key] = [self.field._calculate_individual_E(
+                                    retarded, pcharge_field,
+                                    tuple(np.empty(retarded["r_mag"].shape, dtype) for _ in range(3)))
+                                for retarded in self.retarded]
+        return self._cache[key]
+
+    def E(self, pcharge_field='Total'):
+        """Electric field E (Ex, Ey, Ez) of the point charge(s).
+
+        Args:
+            pcharge_field (str, optional): 'Velocity', 'Acceleration', or 'Total'.
+                Defaults to 'Total'.
+        """
+        key = ('E', pcharge_field)
+        if key not in self._cache:
+            E = self._zeros(3)
+            for retarded, E_field in zip(self.retarded, self._individual_E(pcharge_field)):
+                for total, field in zip(E, E_field):
+                    _add_charges(total, field, retarded)
+            self._cache[key] = E
+        return self._cache[key]
+
+    def B(self, pcharge_field='Total'):
+        """Magnetic field B (Bx, By, Bz) of the point charge(s).
+
+        Args:
+            pcharge_field (str, optional): 'Velocity', 'Acceleration', or 'Total'.
+                Defaults to 'Total'.
+        """
+        key = ('B', pcharge_field)
+        if key not in self._cache:
+            B = self._zeros(3)
+            for retarded, (Ex, Ey, Ez) in zip(self.retarded, self._individual_E(pcharge_field)):
+                rx, ry, rz = retarded["r"]
+                r_mag = retarded["r_mag"]
+                workspace = self.field._workspace(r_mag.shape)
+                cross = workspace("cross")
+                tmp = workspace("tmp")
+                # Griffiths Eq. 10.73, B = r x E/(c|r|)
+                for total, (p, q, Eq, Ep) in zip(B, ((ry, rz, Ez, Ey), (rz, rx, Ex, Ez),
+                                                     (rx, ry, Ey, Ex))):
+                    np.multiply(p, Eq, out=cross)
+                    np.multiply(q, Ep, out=tmp)
+                    cross -= tmp
+                    np.divide(cross, r_mag, out=cross)
+                    cross *= 1/c
+                    _add_charges(total, cross, retarded)
+            self._cache[key] = B
+        return self._cache[key]
+
+    def potentials(self):
+        "Scalar and vector potentials (V, Ax, Ay, Az) of the point charge(s) in the Lorenz gauge."
+        if 'potentials' not in self._cache:
+            V, *A = self._zeros(4)
+            for retarded in self.retarded:
+                r_mag = retarded["r_mag"]
+                workspace = self.field._workspace(r_mag.shape)
+                tmp = workspace("tmp")
+                # Griffiths Eq. 10.53
+                individual_V = _dot(retarded["r"], retarded["beta"], workspace("V"), tmp)
+                np.subtract(r_mag, individual_V, out=individual_V)
+                np.divide(retarded["sign"]*e/(4*pi*eps)/retarded["scale"], individual_V,
+                          out=individual_V)
+                _add_charges(V, individual_V, retarded)
+                # Griffiths Eq. 10.53
+                for total, beta_i in zip(A, retarded["beta"]):
+                    np.multiply(individual_V, beta_i, out=tmp)
+                    tmp *= 1/c
+                    _add_charges(total, tmp, retarded)
+            self._cache['potentials'] = (V, *A)
+        return self._cache['potentials']
+
+    def Poynting(self):
+        "Poynting vector magnitude S of the radiation (acceleration) field."
+        if 'Poynting' not in self._cache:
+            E = self.E('Acceleration')
+            # squares are taken relative to the largest component, which avoids float32 overflow
+            E_max = max(np.max(np.abs(Ei), initial=0, where=np.isfinite(Ei)) for Ei in E)
+            E_max = float(E_max) or 1.
+            S = self._zeros(1)[0]
+            tmp = self.field._workspace(S.shape)("tmp")
+            for Ei in E:
+                np.divide(Ei, E_max, out=tmp)
+                np.square(tmp, out=tmp)
+                S += tmp
+            S *= E_max**2/(mu*c)  # Griffiths 11.67
+            self._cache['Poynting'] = S
+        return self._cache['Poynting']
+
+    def _zeros(self, n):
+        "Returns n zeroed arrays of the grid shape in the field dtype."
+        shape = np.broadcast(self.X, self.Y, self.Z).shape
+        return tuple(np.zeros(shape, self.field.dtype) for _ in range(n))
+
+
+class TiledFieldSnapshot():
+
+    def __init__(self, field, t, X, Y, Z, tile_size):
+        """Fields of the point charge(s) of a MovingChargesField at one time and grid,
+        evaluated in tiles of the flattened grid.
+
+        Only the retarded times and the requested fields are kept for the whole grid;
+        the retarded kinematics and all other temporaries exist for one tile at a time.
+        The retarded times are solved with the first requested quantity and reused by
+        later ones. The results equal those of a FieldSnapshot up to rounding: ChargeEnsembles
+        are chunked per tile, which changes the order in which the charges are summed.
+
+        Args:
+            field (:obj: MovingChargesField): Field of the point charge(s).
+            t (float): Time of simulation in seconds.
+            X (:obj: ndarray(float, ndim=3)): meshgrid of X values in meters.
+            Y (:obj: ndarray(float, ndim=3)): meshgrid of Y values in meters.
+            Z (:obj: ndarray(float, ndim=3)): meshgrid of Z values in meters.
+            tile_size (int): Number of flattened grid points per tile.
+        """
+        self.field = field
+        self.t = t
+        self.X = X
+        self.Y = Y
+        self.Z = Z
+        self.shape = np.broadcast(X, Y, Z).shape
+        size = int(np.prod(self.shape))
+        self.tiles = [slice(start, min(start + tile_size, size))
+                      for start in range(0, size, tile_size)]
+        self.parts = [part for source in field.sources for part in field._parts(source, tile_size)]
+        self._trs = None
+        self._cache = {}
+
+    def matches(self, t, X, Y, Z):
+        "True if the snapshot was taken at time t on the same meshgrid arrays."
+        return t == self.t and X is self.X and Y is self.Y and Z is self.Z
+
+    def _evaluate(self, request):
+        "Evaluates a FieldSnapshot method, given as (name, args), tile by tile."
+        if request not in self._cache:
+            field = self.field
+            flat = [np.broadcast_to(A, self.shape).ravel() for A in (self.X, self.Y, self.Z)]
+            n_tiles = len(self.tiles)
+            if self._trs is None:
+                previous = [self._previous(part) for part in self.parts]
+                trs = [[None]*len(self.parts)]*n_tiles
+                previous = [[None if prev is None else (prev[0], prev[1][..., tile])
+                             for prev in previous] for tile in self.tiles]
+            else:
+                trs = [[tr[..., tile] for tr in self._trs] for tile in self.tiles]
+                previous = [[None]*len(self.parts)]*n_tiles
+            results = field._map(
+                _evaluate_tile, [field]*n_tiles, [self.parts]*n_tiles, [self.t]*n_tiles,
+                *[[A[tile] for tile in self.tiles] for A in flat], trs, previous,
+                [request]*n_tiles)
+
+            out = None
+            tile_trs = []
+            for tile, (values, tr, stats, infos) in zip(self.tiles, results):
+                if out is None:
+                    out = [np.empty(self.shape, field.dtype).ravel() for _ in values]
+                for array, value in zip(out, values):
+                    array[tile] = value
+                tile_trs.append(tr)
+                if field.executor == 'process' and field.workers > 1:
+                    # solves in worker processes are recorded on copies of the field
+                    field._add_stats(stats)
+                    field.last_info.update((part, info) for part, info in zip(self.parts, infos)
+                                           if info is not None)
+            if self._trs is None:
+                self._store_retarded_times(tile_trs)
+            self._cache[request] = tuple(array.reshape(self.shape) for array in out)
+        return self._cache[request]
+
+    def _previous(self, part):
+        "Warm start solution (t_prev, tr_prev) of a part with flattened grid axes, or None."
+        field = self.field
+        previous = field._tr_cache.get((id(part), _grid_key(self.X, self.Y, self.Z)))
+        if not field.warm_start or previous is None:
+            return None
+        t_prev, tr_prev = previous
+        return t_prev, tr_prev.reshape(tr_prev.shape[:tr_prev.ndim - len(self.shape)] + (-1,))
+
+    def _store_retarded_times(self, tile_trs):
+        "Assembles the retarded times of the tiles and keeps them for warm starts."
+        self._trs = []
+        key = _grid_key(self.X, self.Y, self.Z)
+        for i, part in enumerate(self.parts):
+            tr = np.concatenate([trs[i] for trs in tile_trs], axis=-1)
+            self._trs.append(tr)
+            self.field._store_warm_start((id(part), key), self.t,
+                                         tr.reshape(tr.shape[:-1] + self.shape))
+
+    def E(self, pcharge_field='Total'):
+        "Electric field E (Ex, Ey, Ez), see FieldSnapshot.E."
+        return self._evaluate(('E', (pcharge_field,)))
+
+    def B(self, pcharge_field='Total'):
+        "Magnetic field B (Bx, By, Bz), see FieldSnapshot.B."
+        return self._evaluate(('B', (pcharge_field,)))
+
+    def potentials(self):
+        "Scalar and vector potentials (V, Ax, Ay, Az), see FieldSnapshot.potentials."
+        return self._evaluate(('potentials', ()))
+
+    def Poynting(self):
+        "Poynting vector magnitude S, see FieldSnapshot.Poynting."
+        return self._evaluate(('Poynting', ()))[0]
+
+
+def _evaluate_tile(field, parts, t, X, Y, Z, trs, previous, request):
+    """Evaluates a FieldSnapshot method on one tile of a TiledFieldSnapshot. Module level,
+    so that process pools can pickle it."""
+    retarded = [field._retarded_charge(part, t, X, Y, Z, tr=tr, previous=prev, cache=False)
+                for part, tr, prev in zip(parts, trs, previous)]
+    name, args = request
+    values = getattr(FieldSnapshot(field, t, X, Y, Z, retarded=retarded), name)(*args)
+    if name == 'Poynting':
+        values = (values,)
+    infos = [field.last_info.get(part) if tr is None else None for part, tr in zip(parts, trs)]
+    return values, [retarded_charge["tr"] for retarded_charge in retarded], field.stats, infos
+
+
+class FieldWorkspace():
+
+    def __init__(self, shape, dtype):
+        """Scratch arrays of one shape and dtype for the field arithmetic.
+
+        Arrays are allocated on first use and reused by later evaluations on the same
+        grid, so repeated updates do not allocate fresh temporaries for every
+        expression. Results must never be kept in workspace arrays.
+
+        Args:
+            shape (tuple of int): Shape of the arrays.
+            dtype (:obj: numpy dtype): float32 or float64.
+        """
+        self.shape = shape
+        self.dtype = dtype
+        self._arrays = {}
+
+    def __call__(self, name):
+        "Returns the scratch array called name."
+        array = self._arrays.get(name)
+        if array is None:
+            array = self._arrays[name] = np.empty(self.shape, self.dtype)
+        return array
+
+
+def _dot(a, b, out, tmp):
+    "Dot product of two vectors (tuples of arrays) into out, using the scratch array tmp."
+    np.multiply(a[0], b[0], out=out)
+    for a_i, b_i in zip(a[1:], b[1:]):
+        np.multiply(a_i, b_i, out=tmp)
+        out += tmp
+    return out
+
+
+def _add_charges(total, field, retarded):
+    "Adds the field of a source to total, summed over the charge axis of a ChargeEnsemble."
+    if retarded["ensemble"]:
+        total += field.sum(axis=0)
+    else:
+        total += field
+
+
+def _ensemble_restrict(ensemble, charge_index):
+    """Returns a function giving the ensemble charges of a subset of flattened points,
+    where charge_index holds the charge of each point."""
+    return lambda idx: ensemble.pointwise(charge_index[idx])
+
+
+def _grid_key(X, Y, Z):
+    "Cheap fingerprint of a meshgrid, used to match warm start solutions to grids."
+    return (X.shape, X.flat[0], X.flat[-1], Y.flat[0], Y.flat[-1], Z.flat[0], Z.flat[-1])
+
+
+def _reduce_plane(fields, shape):
+    """Drops the singleton axis of a planar meshgrid of the given shape from each field.
+    Fields may have leading axes, such as the time axis of frames."""
+    if shape[0] == 1:
+        return tuple(field[..., 0, :, :] for field in fields)
+    elif shape[1] == 1:
+        return tuple(field[..., :, 0, :] for field in fields)
+    elif shape[2] == 1:
+        return tuple(field[..., :, :, 0] for field in fields)
+    return tuple(fields)
+
 
-        def rhs(R, alpha):
-            tr = t - R/c
-            gamma = (1 - (charge.xvel(tr)**2 + charge.yvel(tr)**2) / c**2)**(-0.5)
-            theta = charge.xytheta(tr)
-            return gamma * (charge.xytheta_dot(tr) + charge.xacc(tr)/c*np.sin(theta+alpha) - charge.yacc(tr)/c*np.cos(theta+alpha)) /c
-        Rmax = lim
-        Rs_eval = np.linspace(1e-3*Rmax, Rmax, Nintsteps)
-        sol = solve_ivp(rhs, (1e-3*Rmax, Rmax), alpha0s, t_eval=Rs_eval)#, solver="Radau")
-        Rs_eval = sol.t[None, :]
-        alphas = sol.y
-        thetas = charge.xytheta(t-Rs_eval)
-        us = charge.xpos(t - Rs_eval/c) + Rs_eval * np.cos(thetas + alphas)
-        vs = charge.ypos(t - Rs_eval/c) + Rs_eval * np.sin(thetas + alphas)
-#         Rs = [0.]
-#         alphas = [alpha0s]
-#         us = [charge.xpos(t)*np.ones(Nlines)]
-#         vs = [charge.ypos(t)*np.ones(Nlines)]
-#         for i in range(Nsteps):
-#             Rs.append(Rs[-1] + dR)
-
-#             tr = t - Rs[-1]/c
-#             gammas = (1 - (charge.xvel(tr)**2 + charge.yvel(tr)**2) / c**2)**(-0.5)
-#             print(i)
-#             theta = charge.xytheta(tr)
-#             print(i, theta)
-#             dalphas = gammas * (charge.xytheta_dot(tr) + charge.xacc(tr)/c*np.sin(theta+alphas[-1]) - charge.yacc(tr)/c*np.cos(theta+alphas[-1])) /c
-# #             print(dalphas)
-#             alphas.append(alphas[-1] + dR * dalphas)
-
-
-#             us.append(charge.xpos(tr) + Rs[-1] * np.cos(theta + alphas[-1]))
-#             vs.append(charge.ypos(tr) + Rs[-1] * np.sin(theta + alphas[-1]))
-        return np.array(us), np.array(vs), np.array(alphas), sol
\ No newline at end of file
+def _upsample(values, i_coarse, j_coarse, i_fine, j_fine):
+    """Bilinear interpolation of values on the grid lines i_coarse, j_coarse (last two
+    axes) to the grid lines i_fine, j_fine."""
+    for axis, coarse, fine in ((-2, i_coarse, i_fine), (-1, j_coarse, j_fine)):
+        position = np.interp(fine, coarse, np.arange(len(coarse)))
+        k = np.clip(position.astype(int), 0, max(len(coarse) - 2, 0))
+        w = (position - k).reshape((-1, 1) if axis == -2 else (-1,))
+        upper = np.take(values, np.minimum(k + 1, len(coarse) - 1), axis=axis)
+        values = (1 - w)*np.take(values, k, axis=axis) + w*upper
+    return values
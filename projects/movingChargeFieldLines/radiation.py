@@ -0,0 +1,180 @@
+"""RadiationPattern class computes the far-field radiation of a periodic point charge
+directly from its kinematics: the period averaged angular distribution of the radiated
+power dP/dOmega and its harmonic spectrum. Only one period of the trajectory is sampled,
+instead of evaluating the Poynting vector on a grid far away from the charge.
+"""
+import numpy as np
+import scipy.constants as constants
+# from charges import Oscillator, OrbittingCharge, OscillatingOrbittingCharge
+
+# Constants
+eps = constants.epsilon_0
+pi = constants.pi
+e = constants.e
+c = constants.c
+
+
+class RadiationPattern():
+
+    def __init__(self, charge, n_theta=90, n_phi=180, n_samples=1024, q=e, max_points=2**20):
+        """Far-field radiation of a periodic point charge on a grid of directions.
+
+        Args:
+            charge (:obj: Charge): Periodic point charge with get_period, e.g. Oscillator,
+                OrbittingCharge or OscillatingOrbittingCharge.
+            n_theta (int, optional): Number of polar angles, the centers of n_theta equal
+                intervals of [0, pi]. Defaults to 90.
+            n_phi (int, optional): Number of azimuths in [0, 2 pi). Defaults to 180.
+            n_samples (int, optional): Number of samples of one period, in retarded time for
+                dP_dOmega and in observer time for harmonics. Defaults to 1024.
+            q (float, optional): Magnitude of the charge in Coulomb. Defaults to e.
+            max_points (int, optional): Largest number of (direction, sample) pairs that are
+                evaluated at once. Defaults to 2**20.
+        """
+        self.charge = charge
+        self.period = charge.get_period()
+        self.w0 = 2*pi/self.period
+        self.theta = (np.arange(n_theta) + 0.5)*pi/n_theta
+        self.phi = np.arange(n_phi)*2*pi/n_phi
+        self.n_samples = n_samples
+        self.q = q
+        self.max_points = max_points
+        self._dP_dOmega = None
+
+    def directions(self):
+        "Unit vectors n of the direction grid, shape (3, n_theta, n_phi)."
+        theta, phi = np.meshgrid(self.theta, self.phi, indexing='ij')
+        return np.stack([np.sin(theta)*np.cos(phi), np.sin(theta)*np.sin(phi), np.cos(theta)])
+
+    def solid_angles(self):
+        "Solid angle of each direction of the grid in sr, shape (n_theta, n_phi)."
+        d_theta = pi/len(self.theta)
+        d_phi = 2*pi/len(self.phi)
+        return np.repeat(2*np.sin(self.theta)[:, None]*np.sin(d_theta/2)*d_phi, len(self.phi), axis=1)
+
+    def dP_dOmega(self):
+        """Period averaged power radiated per solid angle in W/sr, shape (n_theta, n_phi).
+
+        The Lienard power per solid angle of Griffiths Eq. 11.72 is averaged over
+        uniformly sampled retarded times. This equals the average over observer time,
+        since observer and retarded time of a periodic charge advance by one period
+        together.
+        """
+        if self._dP_dOmega is None:
+            tr = np.arange(self.n_samples)*self.period/self.n_samples
+            _, beta, beta_dot = self._kinematics(tr)
+            beta2 = np.sum(beta**2, axis=0)
+            beta_dot2 = np.sum(beta_dot**2, axis=0)
+            beta_beta_dot = np.sum(beta*beta_dot, axis=0)
+            pattern = []
+            for n in self._direction_blocks():
+                n_dot_u = 1 - n @ beta
+                n_dot_beta_dot = n @ beta_dot
+                # |n x (u x beta_dot)|**2 with u = n - beta, expanded into dot products
+                numerator = ((1 - 2*(1 - n_dot_u) + beta2)*n_dot_beta_dot**2
+                             - 2*n_dot_beta_dot*n_dot_u*(n_dot_beta_dot - beta_beta_dot)
+                             + beta_dot2*n_dot_u**2)
+                pattern.append(np.mean(numerator/n_dot_u**5, axis=-1))
+            self._dP_dOmega = self._prefactor()*np.concatenate(pattern).reshape(
+                len(self.theta), len(self.phi))
+        return self._dP_dOmega
+
+    def total_power(self):
+        "Period averaged power in W radiated into all directions of the grid."
+        return np.sum(self.dP_dOmega()*self.solid_angles())
+
+    def lienard_power(self):
+        """Period averaged total power in W from the Lienard formula (Griffiths Eq. 11.73),
+        a reference for total_power."""
+        tr = np.arange(self.n_samples)*self.period/self.n_samples
+        _, beta, beta_dot = self._kinematics(tr)
+        gamma2 = 1/(1 - np.sum(beta**2, axis=0))
+        cross2 = np.sum(np.cross(beta, beta_dot, axis=0)**2, axis=0)
+        power = gamma2**3*(np.sum(beta_dot**2, axis=0) - cross2)
+        return self.q**2/(6*pi*eps*c)*np.mean(power)
+
+    def harmonics(self, n_harmonics=None):
+        """Power radiated per solid angle into the harmonics m*w0 of the charge frequency.
+
+        The radiation field is sampled at n_samples uniform observer times of one period,
+        whose retarded times are found by Newton iterations, and Fourier transformed.
+        The harmonics sum up to dP_dOmega if n_samples resolves the emitted pulses.
+
+        Args:
+            n_harmonics (int, optional): Highest harmonic returned. Defaults to n_samples//2.
+
+        Returns:
+            harmonic numbers m (starting at 0) and dP_m/dOmega in W/sr, shape
+            (len(m), n_theta, n_phi).
+        """
+        if n_harmonics is None:
+            n_harmonics = self.n_samples//2
+        n_harmonics = min(n_harmonics, self.n_samples//2)
+        power = []
+        for n in self._direction_blocks():
+            F = self._radiation_field(n, self._observer_samples(n))
+            coefficients = np.fft.rfft(F, axis=-1)[..., :n_harmonics + 1]/self.n_samples
+            block = np.sum(np.abs(coefficients)**2, axis=0)
+            # the real field has the harmonics +m and -m
+            block[:, 1:] *= 2
+            if self.n_samples % 2 == 0 and n_harmonics == self.n_samples//2:
+                block[:, -1] /= 2
+            power.append(block)
+        power = self._prefactor()*np.concatenate(power)
+        return (np.arange(n_harmonics + 1),
+                np.moveaxis(power, -1, 0).reshape(-1, len(self.theta), len(self.phi)))
+
+    def spectrum(self, n_harmonics=None):
+        """Period averaged power in W radiated into each harmonic m*w0, see harmonics.
+
+        Returns:
+            harmonic numbers m and the power of each harmonic.
+        """
+        m, dP_m_dOmega = self.harmonics(n_harmonics)
+        return m, np.sum(dP_m_dOmega*self.solid_angles(), axis=(1, 2))
+
+    def _prefactor(self):
+        return self.q**2/(16*pi**2*eps*c)
+
+    def _direction_blocks(self):
+        "Directions in blocks of at most max_points/n_samples, each shape (block, 3)."
+        n = self.directions().reshape(3, -1).T
+        size = max(self.max_points//self.n_samples, 1)
+        for start in range(0, len(n), size):
+            yield n[start:start + size]
+
+    def _kinematics(self, tr):
+        "Position in m, beta and beta_dot in 1/s of the charge, each shape (3,) + tr.shape."
+        pos, v, a = self.charge.kinematics(tr)
+        pos, v, a = (np.stack([np.broadcast_to(np.asarray(ai, dtype=float), np.shape(tr))
+                               for ai in vector]) for vector in (pos, v, a))
+        return pos, v/c, a/c
+
+    def _observer_samples(self, n, newton_steps=2):
+        """Retarded times of n_samples uniform observer times t = tr - n.r(tr)/c of one
+        period for each direction n, shape (block, n_samples)."""
+        samples = self.n_samples
+        tr = np.arange(samples + 1)*self.period/samples
+        t = tr - n @ self._kinematics(tr)[0]/c
+        t_target = t[:, :1] + np.arange(samples)*self.period/samples
+        # t(tr) increases monotonically, so one interpolation over all directions works
+        # after shifting every direction by a multiple of twice the period
+        offset = 2*self.period*np.arange(len(t))[:, None]
+        guess = np.interp((t_target + offset).ravel(), (t + offset).ravel(),
+                          np.broadcast_to(tr, t.shape).ravel()).reshape(t_target.shape)
+        for _ in range(newton_steps):
+            pos, beta, _ = self._kinematics(guess)
+            residual = guess - np.einsum('di,idn->dn', n, pos)/c - t_target
+            guess = guess - residual/(1 - np.einsum('di,idn->dn', n, beta))
+        return guess
+
+    def _radiation_field(self, n, tr):
+        """Radiation field n x ((n - beta) x beta_dot)/(1 - n.beta)**3 in 1/s, the
+        acceleration field of Griffiths Eq. 10.72 times 4 pi eps c R/q, at the retarded
+        times tr of shape (block, n_samples). Returns shape (3, block, n_samples)."""
+        _, beta, beta_dot = self._kinematics(tr)
+        n_dot_u = 1 - np.einsum('di,idn->dn', n, beta)
+        n_dot_beta_dot = np.einsum('di,idn->dn', n, beta_dot)
+        # n x (u x beta_dot) = u (n.beta_dot) - beta_dot (n.u) with u = n - beta
+        return ((n.T[:, :, None] - beta)*(n_dot_beta_dot/n_dot_u**3)
+                - beta_dot/n_dot_u**2)
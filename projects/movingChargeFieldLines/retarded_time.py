@@ -0,0 +1,168 @@
+"""RetardedTimeSolver class solves the retarded time of a point charge on a whole
+grid of field points. For charges slower than light the residual of Griffiths
+Eq. 10.55 is strictly increasing in the retarded time, so every grid point has a
+unique root that can be bracketed. The solver combines Newton steps with bisection
+inside that bracket and only iterates the points that have not converged yet.
+"""
+import numpy as np
+import scipy.constants as constants
+
+# Constants
+c = constants.c
+
+
+class RetardedTimeSolver():
+
+    def __init__(self, tol=1e-20, maxiter=50, max_bracket_steps=60):
+        """Safeguarded Newton/bisection solver for the retarded time.
+
+        Args:
+            tol (float, optional): Absolute tolerance on the retarded time in seconds.
+                Defaults to 1e-20.
+            maxiter (int, optional): Maximum number of Newton/bisection iterations per
+                grid point. Defaults to 50.
+            max_bracket_steps (int, optional): Maximum number of doublings used to find
+                a lower bracket. Defaults to 60.
+        """
+        self.tol = tol
+        self.maxiter = maxiter
+        self.max_bracket_steps = max_bracket_steps
+
+    def solve(self, charge, t, X, Y, Z, tr0=None, restrict=None):
+        """Solves |R - r(tr)| = c(t - tr) for the retarded time tr at every grid point.
+
+        Args:
+            charge (:obj: Charge): Point charge.
+            t (float or ndarray): Time of simulation in seconds, broadcastable to X.
+            X (:obj: ndarray(float)): X values of the field points in meters.
+            Y (:obj: ndarray(float)): Y values of the field points in meters.
+            Z (:obj: ndarray(float)): Z values of the field points in meters.
+            tr0 (:obj: ndarray(float), optional): Starting guess of the retarded time.
+                Defaults to t.
+            restrict (callable, optional): Returns the charge for a subset of the flattened
+                grid points, for charges whose parameters vary between points (see
+                ChargeEnsemble.pointwise). Defaults to using charge everywhere.
+
+        Returns:
+            tr ndarray with the shape of X and a dict of convergence diagnostics:
+            'converged' (bool ndarray), 'iterations' (int ndarray), 'residual'
+            (ndarray, |R - r(tr)| - c(t - tr) in meters), 'sweeps' (int, number of
+            iterations of the slowest point) and 'evaluations' (int, number of
+            pointwise residual evaluations).
+        """
+        shape = np.broadcast(X, Y, Z).shape
+        X = np.broadcast_to(X, shape).ravel()
+        Y = np.broadcast_to(Y, shape).ravel()
+        Z = np.broadcast_to(Z, shape).ravel()
+        t = np.broadcast_to(np.asarray(t, dtype=float), shape).ravel()
+        size = t.size
+        evaluations = [0]
+
+        def charge_at(idx):
+            return charge if restrict is None else restrict(idx)
+
+        def residual(point_charge, tr, t, X, Y, Z):
+            evaluations[0] += len(tr)
+            return self._residual(point_charge, tr, t, X, Y, Z)
+
+        # f(t) = |R - r(t)| >= 0 is always an upper bracket
+        hi = t.copy()
+        lo = np.full(size, -np.inf)
+        if tr0 is None:
+            tr = t.copy()
+        else:
+            tr0 = np.broadcast_to(tr0, shape).ravel()
+            tr = np.where(np.isfinite(tr0), np.minimum(tr0, t), t)
+        f, fp = residual(charge_at(np.arange(size)), tr, t, X, Y, Z)
+        below = f <= 0
+        lo[below] = tr[below]
+        hi[~below] = tr[~below]
+
+        # lower bracket: step back from the upper bracket until f <= 0, starting
+        # with the retarded time of a charge at rest at its current position
+        idx = np.flatnonzero(~below)
+        step = f[idx]/c
+        for _ in range(self.max_bracket_steps):
+            if len(idx) == 0:
+                break
+            trial = hi[idx] - step
+            f_trial, fp_trial = residual(charge_at(idx), trial, t[idx], X[idx], Y[idx], Z[idx])
+            found = f_trial <= 0
+            # continue from the closer end of the bracket
+            lo[idx[found]] = trial[found]
+            hi[idx[~found]] = trial[~found]
+            tr[idx] = trial
+            f[idx] = f_trial
+            fp[idx] = fp_trial
+            idx = idx[~found]
+            step = 2*step[~found]
+        bracketed = np.isfinite(lo)
+
+        iterations = np.zeros(size, dtype=int)
+        converged = (f == 0) | ~bracketed
+        # the active set is kept compacted, finished points are written back
+        active = np.flatnonzero(~converged)
+        state = [tr[active], lo[active], hi[active], f[active], fp[active],
+                 t[active], X[active], Y[active], Z[active]]
+        sweeps = 0
+        while len(active) > 0 and sweeps < self.maxiter:
+            sweeps += 1
+            tr_a, lo_a, hi_a, f_a, fp_a = state[:5]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                newton = tr_a - f_a/fp_a
+            # fall back to bisection when the Newton step leaves the bracket
+            inside = (newton > lo_a) & (newton < hi_a)
+            tr_new = np.where(inside, newton, 0.5*(lo_a + hi_a))
+            tol = np.maximum(self.tol, 4*np.finfo(float).eps*np.abs(tr_new))
+            # a step below tolerance converges without another residual evaluation
+            done = np.abs(tr_new - tr_a) <= tol
+            state[0] = tr_new
+            active, state, tol = self._retire(done, active, state, tol, tr, f, converged,
+                                              iterations, sweeps)
+            tr_a, lo_a, hi_a, _, _, t_a, X_a, Y_a, Z_a = state
+            f_a, fp_a = residual(charge_at(active), tr_a, t_a, X_a, Y_a, Z_a)
+            below = f_a <= 0
+            lo_a = np.where(below, tr_a, lo_a)
+            hi_a = np.where(below, hi_a, tr_a)
+            state[1:5] = [lo_a, hi_a, f_a, fp_a]
+            done = (f_a == 0) | (hi_a - lo_a <= tol)
+            active, state, _ = self._retire(done, active, state, tol, tr, f, converged,
+                                            iterations, sweeps)
+        # points left after maxiter keep their last iterate
+        tr[active] = state[0]
+        f[active] = state[3]
+        iterations[active] = sweeps
+        converged &= bracketed
+
+        info = {
+            "converged": converged.reshape(shape),
+            "iterations": iterations.reshape(shape),
+            "residual": f.reshape(shape),
+            "sweeps": sweeps,
+            "evaluations": evaluations[0],
+        }
+        return tr.reshape(shape), info
+
+    @staticmethod
+    def _retire(done, active, state, tol, tr, f, converged, iterations, sweeps):
+        """Writes the finished points back and compacts the active set."""
+        finished = active[done]
+        tr[finished] = state[0][done]
+        f[finished] = state[3][done]
+        converged[finished] = True
+        iterations[finished] = sweeps
+        keep = ~done
+        return active[keep], [array[keep] for array in state], tol[keep]
+
+    @staticmethod
+    def _residual(charge, tr, t, X, Y, Z):
+        """Residual of Griffiths Eq. 10.55 and its derivative with respect to tr."""
+        (x, y, z), (vx, vy, vz), _ = charge.kinematics(tr)
+        rx = X - x
+        ry = Y - y
+        rz = Z - z
+        r_mag = (rx**2 + ry**2 + rz**2)**0.5
+        r_dot_v = rx*vx + ry*vy + rz*vz
+        with np.errstate(divide='ignore', invalid='ignore'):
+            n_dot_v = np.where(r_mag > 0, r_dot_v/r_mag, 0)
+        return r_mag - c*(t - tr), c - n_dot_v